@@ -5,10 +5,24 @@ Compile information from skims for overviews
 
 :warning: Currently, skims and directories are expected to have a unique 1:1
           relation. This constraint will likely be dropped in the future.
+
+With ``--inventory``, the information on skims is kept in a database and only
+updated for new or changed files; see :py:class:`~.SkimInventory`.
+
+With ``--estimate``, only a random sample of the files of each skim is opened.
+The event count of the skim is extrapolated from the events per byte of the
+sample, and reported with its uncertainty; see :py:func:`~.estimate_events`.
+
+Skims stored at several sites are reported together by merging snapshots:
+each site scans its own storage once, with ``--site`` naming it, and writes
+a snapshot via ``--export``. Any host can then ``--merge`` the snapshot files
+into a single report, without accessing the storage of any site. Skims are
+matched by their path relative to DATAPATH and by their files.
+
 **Requires**
 
 :py:mod:`argparse`
-:py:mod:`ROOT` (optional)
+:py:mod:`ROOT`, :py:mod:`uproot` (optional, see :py:mod:`utility.event_count`)
 
 **Arguments**
 
@@ -16,43 +30,54 @@ Compile information from skims for overviews
    :ref: gc_clone_output.CLI
    :prog: gc_clone_output
 """
-try:
-    import ROOT
-    # suppress ROOT output
-    ROOT.PyConfig.IgnoreCommandLineOptions = True
-    ROOT.gErrorIgnoreLevel = ROOT.kError
-except ImportError:
-    ROOT = None
 import os
 import sys
-import glob
+import errno
+import fnmatch
+import stat
+import multiprocessing
+import multiprocessing.pool
+import threading
+import heapq
 import argparse
+import sqlite3
 import socket
 import logging
 import collections
 import itertools
 import ast
+import csv
+import json
+import math
+import random
 
 # third party imports
 
 # application/library imports
 from utility.utils import flatten
+from utility.exceptions import AbstractError
+from utility import event_count
 
 
 logger = logging.getLogger()
 
-if ROOT is not None:
-    def get_event_count(file_path, branch_name="Events"):
-        try:
-            data = ROOT.TFile(file_path)
-            return data.Get(branch_name).GetEntries()
-        except AttributeError:
-            # some data structure is missing
-            return -1
-else:
-    def get_event_count(file_path, branch_name="Events"):
+
+def get_event_count(file_path, branch_name="Events", counter_options=None):
+    try:
+        return event_count.get_counter(**(counter_options or {})).get_entries(file_path, branch_name)
+    except (KeyError, ValueError):
+        # some data structure is missing
         return -1
 
+
+def _count_skim_file_events(skim_file_options):
+    file_key, file_path, counter_options = skim_file_options
+    if file_path is None:
+        # placeholder for a skim without files to count
+        return file_key, 0
+    return file_key, get_event_count(file_path, counter_options=counter_options)
+
+
 CLI = argparse.ArgumentParser(
     description="Pretty-Print information on skims",
     epilog="This script will descend into subdirectories of DATAPATH, looking "
@@ -65,11 +90,89 @@ CLI.add_argument(
     nargs="*",
     help="Basepath to any skims"
 )
+CLI.add_argument(
+    "--site",
+    default=socket.gethostname()[:3].upper(),
+    help="Name of the site storing the skims [%(default)s]",
+)
+CLI.add_argument(
+    "--export",
+    default=None,
+    metavar="SNAPSHOT",
+    help="Write a snapshot of all skims found at this site to SNAPSHOT",
+)
+CLI.add_argument(
+    "--merge",
+    nargs="+",
+    default=None,
+    metavar="SNAPSHOT",
+    help="Report the skims of snapshots from several sites instead of scanning DATAPATH",
+)
 CLI.add_argument(
     "-f",
     "--formatter",
     default="raw",
-    help="Style to use for output [%(default)s]",
+    help="Style to use for output, any of raw, twiki, json or csv, with arguments"
+         " such as 'twiki(compact=True)' or 'json(files=True)' [%(default)s]",
+)
+CLI.add_argument(
+    "--backend",
+    default="auto",
+    choices=sorted(event_count.BACKENDS),
+    help="Backend for counting events [%(default)s]",
+)
+CLI.add_argument(
+    "--cache-path",
+    default=None,
+    help="Path of the event count cache [%s]" % event_count.default_cache_path(),
+)
+CLI.add_argument(
+    "--no-cache",
+    action="store_false",
+    dest="cache",
+    help="Do not use the event count cache",
+)
+CLI.add_argument(
+    "--refresh",
+    action="store_true",
+    help="Count all events anew, replacing cached event counts",
+)
+CLI.add_argument(
+    "--list-workers",
+    type=int,
+    default=8,
+    help="Number of directories listed concurrently while searching skims [%(default)s]",
+)
+CLI.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of processes counting events in parallel [%(default)s]",
+)
+CLI.add_argument(
+    "--estimate",
+    type=float,
+    default=None,
+    metavar="FRACTION",
+    help="Estimate event counts from a random FRACTION of the files of each skim",
+)
+CLI.add_argument(
+    "--estimate-min-files",
+    type=int,
+    default=20,
+    help="Minimum number of files sampled per skim; smaller skims are counted exactly [%(default)s]",
+)
+CLI.add_argument(
+    "--seed",
+    type=int,
+    default=0,
+    help="Seed for sampling files to estimate event counts [%(default)s]",
+)
+CLI.add_argument(
+    "--inventory",
+    default=None,
+    help="Database of skims to update incrementally and to show skims from",
 )
 CLI.add_argument(
     "-v",
@@ -81,19 +184,23 @@ CLI.add_argument(
 
 
 def formatter_factory(formatter_str):
-    for formatter in [RawFormatter, TwikiFormatter]:
+    formatters = [RawFormatter, TwikiFormatter, JSONFormatter, CSVFormatter]
+    for formatter in formatters:
         try:
             return formatter.from_raw(formatter_str)
-        except SyntaxWarning as err:
-            print err
+        except SyntaxWarning:
+            # keep stdout clean for machine-readable formats
+            logger.log(1, "formatter %s does not match '%s'", formatter.__name__, formatter_str)
     raise ValueError("Formatter string '%s' does not match '%s'" % (
         formatter_str,
-        ",".join(itertools.chain(RawFormatter.formatter_string, TwikiFormatter.formatter_string
-    ))))
+        ",".join(itertools.chain.from_iterable(formatter.formatter_string for formatter in formatters))
+    ))
 
 
 class BaseFormatter(object):
     formatter_string = []
+    #: whether skims should include the information on each of their files
+    file_details = False
 
     @staticmethod
     def _read_args(args_string):
@@ -113,6 +220,24 @@ class BaseFormatter(object):
             return cls(*args, **kwargs)
         raise SyntaxWarning
 
+    def measure(self, skim_info):
+        """Inspect a skim before any are digested, e.g. to align output"""
+        pass
+
+    def digest(self, skim_info):
+        """Format a skim"""
+        raise AbstractError
+
+    def close(self):
+        """Write any output pending after all skims have been digested"""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
 
 class RawFormatter(BaseFormatter):
     formatter_string = ["raw", "RawOutput"]
@@ -131,21 +256,60 @@ class RawFormatter(BaseFormatter):
 
 
 class TwikiFormatter(BaseFormatter):
+    """
+    Format skims as rows of a Twiki table
+
+    Rows are written as soon as a skim is digested if the output is
+    ``compact`` or if all skims have been :py:meth:`measure`\ d before.
+    Otherwise, rows are collected to align columns when :py:meth:`close` is
+    called.
+    """
     formatter_string = ["twiki", "TwikiFormatter"]
     _undefined_field = "---"
+    _header = ("*Type*", "*Dataset (DBS)*", "*Path*", "*Global Tag*", "*Cross-section (pb)*", "*No. Events*", "*Size [B]*")
 
     def __init__(self, compact=False):
         self.compact = compact
-        self.table_lines = [("*Type*", "*Dataset (DBS)*", "*Path*", "*Global Tag*", "*Cross-section (pb)*", "*No. Events*", "*Size [B]*")]
+        self.table_lines = []
+        self.item_lengths = None
+        self._header_written = False
+        self._closed = False
 
     def __del__(self):
-        if self.compact:
-            for line in self.table_lines:
+        # close explicitly, output written at shutdown may get lost
+        if not self._closed:
+            self.close()
+
+    def _write_lines(self, lines):
+        if not self._header_written:
+            self._header_written = True
+            self._write_lines([self._header])
+        for line in lines:
+            if self.compact:
                 print "| %s |" % " | ".join(str(item) for item in line)
-        else:
-            item_lengths = [max(len(str(item)) for item in column) for column in zip(*self.table_lines)]
-            for line in self.table_lines:
-                print "| %s |" % " | ".join(str(line[idx]).center(item_lengths[idx]) for idx in xrange(len(line)))
+            else:
+                print "| %s |" % " | ".join(str(line[idx]).center(self.item_lengths[idx]) for idx in xrange(len(line)))
+
+    def _measure_lines(self, lines):
+        if self.item_lengths is None:
+            self.item_lengths = [len(str(item)) for item in self._header]
+        for line in lines:
+            self.item_lengths = [max(length, len(str(item))) for length, item in zip(self.item_lengths, line)]
+
+    def measure(self, skim_info):
+        if not self.compact:
+            self._measure_lines(self._skim_lines(skim_info))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.table_lines:
+            self._measure_lines(self.table_lines)
+        elif self.item_lengths is None:
+            self._measure_lines([])
+        self._write_lines(self.table_lines)
+        self.table_lines = []
 
     def _format_path(self, path_dict):
         return (
@@ -153,69 +317,692 @@ class TwikiFormatter(BaseFormatter):
             r"%NAVY%NAF:%ENDCOLOR% " + path_dict.get("NAF", self._undefined_field)
         )
 
+    def _format_events(self, skim_info):
+        if "event_count_error" in skim_info:
+            return "~%s +- %s" % (skim_info["event_count"], skim_info["event_count_error"])
+        return skim_info.get("event_count", self._undefined_field)
+
     def digest(self, skim_info):
+        lines = self._skim_lines(skim_info)
+        if self.compact or self.item_lengths is not None:
+            self._write_lines(lines)
+        else:
+            self.table_lines.extend(lines)
+
+    def _skim_lines(self, skim_info):
         columns = [
             skim_info.get("type", self._undefined_field),
             skim_info.get("dbs", self._undefined_field),
             self._format_path(skim_info["path"]),
             skim_info.get("globaltag", self._undefined_field),
             skim_info.get("xsection", self._undefined_field),
-            skim_info.get("event_count", self._undefined_field),
+            self._format_events(skim_info),
             skim_info.get("file_size", self._undefined_field),
         ]
         columns = [flatten(column) for column in columns]
         line_count = max(len(column) for column in columns)
         columns = [flatten(column) + ["^"]*(line_count-len(column)) for column in columns]
-        self.table_lines.extend(zip(*columns))
+        return zip(*columns)
+
+
+class JSONFormatter(BaseFormatter):
+    """
+    Format each skim as a line of JSON
+
+    :param files: include the information on each file of a skim
+    :type files: bool
+    """
+    formatter_string = ["json", "JSONFormatter"]
+
+    def __init__(self, files=False):
+        self.file_details = files
+
+    def digest(self, skim_info):
+        sys.stdout.write(json.dumps(skim_info, sort_keys=True) + "\n")
+        sys.stdout.flush()
+
+
+class CSVFormatter(BaseFormatter):
+    """
+    Format each skim as a row of CSV
+
+    :param files: write a row for each file of a skim instead
+    :type files: bool
+    """
+    formatter_string = ["csv", "CSVFormatter"]
+    _skim_columns = ("path", "file_count", "file_size", "event_count", "event_count_error")
+    _file_columns = ("path", "name", "size", "mtime", "event_count")
 
+    def __init__(self, files=False):
+        self.file_details = files
+        self._writer = csv.writer(sys.stdout)
+        self._writer.writerow(self._file_columns if files else self._skim_columns)
 
+    def digest(self, skim_info):
+        path = " ".join(skim_info["path"][site] for site in sorted(skim_info["path"]))
+        if self.file_details:
+            self._writer.writerows(
+                [path] + [file_info[column] for column in self._file_columns[1:]]
+                for file_info in skim_info["files"]
+            )
+        else:
+            self._writer.writerow([path] + [skim_info.get(column, "") for column in self._skim_columns[1:]])
+        sys.stdout.flush()
+
+
+def _scan_dir(dirpath):
+    """
+    List a directory once, checking for '*.root' files and subdirectories
+
+    :return: the directory, whether it contains skim files, and its subdirectories
+    :rtype: tuple[str, bool, list[str]]
+    """
+    try:
+        dir_names = os.listdir(dirpath)
+    except OSError as err:
+        # like os.walk, ignore unreadable directories
+        if err.errno != errno.ENOENT:
+            logger.warning("cannot list directory %s: %s", dirpath, err)
+        return dirpath, False, []
+    is_skim = any(not name.startswith(".") and fnmatch.fnmatch(name, "*.root") for name in dir_names)
+    sub_dirs = []
+    for name in dir_names:
+        sub_path = os.path.join(dirpath, name)
+        try:
+            # like os.walk, do not follow symbolic links
+            if stat.S_ISDIR(os.lstat(sub_path).st_mode):
+                sub_dirs.append(sub_path)
+        except OSError:
+            pass
+    return dirpath, is_skim, sub_dirs
 
-def find_skims_dirs(datapath):
+
+def find_skims_dirs(datapath, workers=8):
     """
     Walk through directories, locating any that contain '*.root' files
 
+    Each directory is listed only once. The directories of each level of the
+    tree are listed concurrently by ``workers`` threads, but are reported
+    sorted by path.
+
     :param datapath: basepath to start search from
     :type datapath: str
-    :return: directories containing skims
-    :rtype: list[str]
+    :param workers: number of directories listed concurrently
+    :type workers: int
+    :return: directories containing skims, level by level
+    :rtype: iterable[str]
     """
-    skim_dirs = []
-    for dirpath, _, _ in os.walk(datapath):
-        if glob.glob(os.path.join(dirpath, '*.root')):
-            logger.log(2, "adding skim dir %s", dirpath)
-            skim_dirs.append(dirpath)
-    return skim_dirs
-
-
-def collect_skim_info(skim_dir):
+    pool = multiprocessing.pool.ThreadPool(max(1, workers))
+    try:
+        dir_paths = [datapath]
+        while dir_paths:
+            sub_dirs = []
+            for dirpath, is_skim, dir_subs in pool.imap(_scan_dir, sorted(dir_paths)):
+                if is_skim:
+                    logger.log(2, "adding skim dir %s", dirpath)
+                    yield dirpath
+                sub_dirs.extend(dir_subs)
+            dir_paths = sub_dirs
+    finally:
+        pool.terminate()
+
+
+def list_skim_files(skim_dir):
     """
-    Collect all information available on a skim from its directory
+    List the '*.root' files of a skim with a single listing of its directory
 
     :param skim_dir: directory containing the skim files
     :type skim_dir: str
-    :return:
-    :rtype: dict
+    :return: path and stat result of each file
+    :rtype: list[tuple[str, posix.stat_result]]
+    """
+    skim_files = []
+    for name in sorted(os.listdir(skim_dir)):
+        if name.startswith(".") or not fnmatch.fnmatch(name, "*.root"):
+            continue
+        file_path = os.path.join(skim_dir, name)
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            # removed while listing
+            continue
+        if stat.S_ISREG(file_stat.st_mode):
+            skim_files.append((file_path, file_stat))
+    return skim_files
+
+
+def sample_skim_files(skim_dir, skim_files, fraction, min_files=20, seed=0):
     """
-    logger.log(2, "collecting information on skim %s", skim_dir)
+    Select a random sample of the files of a skim
+
+    The sample only depends on ``seed`` and the skim, not on other skims.
+
+    :param skim_files: path and stat result of each file
+    :type skim_files: list[tuple[str, posix.stat_result]]
+    :param fraction: fraction of files to sample
+    :type fraction: float
+    :param min_files: minimum number of files to sample, at least 2 for an uncertainty
+    :type min_files: int
+    :return: indices of the sampled files
+    :rtype: list[int]
+    """
+    sample_size = max(min_files, 2, int(math.ceil(fraction * len(skim_files))))
+    if sample_size >= len(skim_files):
+        return range(len(skim_files))
+    return sorted(random.Random("%s:%s" % (seed, skim_dir)).sample(xrange(len(skim_files)), sample_size))
+
+
+def estimate_events(samples, file_count, file_size):
+    """
+    Estimate the events of a skim from a sample of its files
+
+    Events are extrapolated with the ratio of events and size of the sampled
+    files. The uncertainty is the standard error of this ratio estimator.
+
+    :param samples: size and event count of each sampled file
+    :type samples: list[tuple[int, int]]
+    :param file_count: number of all files
+    :type file_count: int
+    :param file_size: size of all files
+    :type file_size: int
+    :return: estimated event count and its uncertainty
+    :rtype: tuple[float, float]
+    """
+    sample_count = len(samples)
+    sample_size = sum(size for size, _ in samples)
+    if not sample_size:
+        return 0.0, 0.0
+    ratio = float(sum(events for _, events in samples)) / sample_size
+    if sample_count >= file_count or sample_count < 2:
+        return ratio * file_size, 0.0
+    residual_var = sum((events - ratio * size) ** 2 for size, events in samples) / (sample_count - 1)
+    finite_correction = 1.0 - float(sample_count) / file_count
+    return ratio * file_size, file_count * math.sqrt(finite_correction * residual_var / sample_count)
+
+
+def collect_skims_info(
+        skim_dirs, counter_options=None, pool=None, file_details=False, estimate=None, min_files=20, seed=0,
+        site=None):
+    """
+    Collect all information available on several skims from their directories
+
+    Skims are listed as they are found, and their files are counted in a
+    single queue, largest files first, see :py:func:`~._count_tasks`. A pool
+    thus stays busy while further skims are found; each skim is reported as
+    soon as all its files are counted.
+
+    :param skim_dirs: directories containing the skim files
+    :type skim_dirs: iterable[str]
+    :param counter_options: keyword arguments to :py:func:`~utility.event_count.get_counter`
+    :type counter_options: dict or None
+    :param pool: process pool for counting the events of files in parallel
+    :type pool: :py:class:`multiprocessing.pool.Pool` or None
+    :param file_details: include the information on each file of a skim
+    :type file_details: bool
+    :param estimate: fraction of files to sample for estimating event counts
+    :type estimate: float or None
+    :param min_files: minimum number of files to sample, see :py:func:`~.sample_skim_files`
+    :type min_files: int
+    :param seed: seed for sampling files
+    :type seed: int
+    :param site: name of the site storing the skims
+    :type site: str or None
+    :return: information on each skim, in the order skims are completed
+    :rtype: iterable[dict]
+    """
+    skims = {}
+
+    def skim_tasks():
+        for skim_idx, skim_dir in enumerate(skim_dirs):
+            logger.log(2, "collecting information on skim %s", skim_dir)
+            skim_files = list_skim_files(skim_dir)
+            if estimate is not None:
+                file_indices = sample_skim_files(skim_dir, skim_files, estimate, min_files=min_files, seed=seed)
+            else:
+                file_indices = range(len(skim_files))
+            skims[skim_idx] = {
+                "skim_dir": skim_dir,
+                "site": site,
+                "pending": len(file_indices),
+                "file_count": len(skim_files),
+                "file_size": sum(file_stat.st_size for _, file_stat in skim_files),
+                "event_count": 0,
+                "samples": [] if len(file_indices) < len(skim_files) else None,
+                "sizes": [file_stat.st_size for _, file_stat in skim_files],
+                "files": [
+                    make_file_info(file_path, file_stat.st_size, file_stat.st_mtime, None)
+                    for file_path, file_stat in skim_files
+                ] if file_details else None,
+            }
+            if not file_indices:
+                yield _PLACEHOLDER_SIZE, ((skim_idx, None), None, counter_options)
+            for file_idx in file_indices:
+                file_path, file_stat = skim_files[file_idx]
+                yield file_stat.st_size, ((skim_idx, file_idx), file_path, counter_options)
+
+    for (skim_idx, file_idx), events in _count_tasks(skim_tasks(), pool):
+        skim = skims[skim_idx]
+        if file_idx is not None:
+            skim["event_count"] += events
+            skim["pending"] -= 1
+            if skim["files"] is not None:
+                skim["files"][file_idx]["event_count"] = events
+            if skim["samples"] is not None:
+                skim["samples"].append((skim["sizes"][file_idx], events))
+        if not skim["pending"]:
+            del skims[skim_idx]
+            yield _finish_skim_info(skim)
+
+
+#: size of placeholder tasks, which are handed out before any others
+_PLACEHOLDER_SIZE = float("inf")
+
+
+def _count_tasks(tasks, pool=None, lookahead=10000):
+    """
+    Count the events of files as tasks are created
+
+    With a ``pool``, ``tasks`` is consumed by a thread of the pool, so that
+    new tasks are created while files are counted. Up to ``lookahead`` tasks
+    are held back, and the largest file is handed out whenever a worker is
+    idle. A large file scheduled last would keep a single worker busy at the
+    end, even if its skim is found last.
+
+    :param tasks: size of the file and argument to :py:func:`~._count_skim_file_events` of each task
+    :type tasks: iterable[tuple[float, tuple]]
+    :param pool: process pool for counting the events of files in parallel
+    :type pool: :py:class:`multiprocessing.pool.Pool` or None
+    :param lookahead: maximum number of tasks held back for ordering
+    :type lookahead: int
+    :return: key of the file and its event count, in the order files are counted
+    :rtype: iterable[tuple[object, int]]
+    """
+    if pool is None:
+        for _, task in tasks:
+            yield _count_skim_file_events(task)
+        return
+    # keep a few tasks queued in the pool, so that no worker waits for the next
+    pool_size = pool._processes
+    idle_slots = threading.Semaphore(2 * pool_size)
+    done = []
+
+    def ordered_tasks():
+        queue = []
+        for task_idx, (size, task) in enumerate(tasks):
+            heapq.heappush(queue, (-size, task_idx, task))
+            while queue and not done and idle_slots.acquire(len(queue) > lookahead):
+                yield heapq.heappop(queue)[2]
+            if done:
+                return
+        while queue and not done:
+            idle_slots.acquire()
+            yield heapq.heappop(queue)[2]
+
+    try:
+        for result in pool.imap_unordered(_count_skim_file_events, ordered_tasks()):
+            idle_slots.release()
+            yield result
+    finally:
+        # never leave the thread of the pool waiting for a slot
+        done.append(True)
+        for _ in xrange(2 * pool_size):
+            idle_slots.release()
+
+
+def _finish_skim_info(skim):
+    if skim["samples"] is None:
+        return make_skim_info(
+            skim["skim_dir"], skim["file_count"], skim["file_size"], skim["event_count"], skim["files"], skim["site"]
+        )
+    events, error = estimate_events(skim["samples"], skim["file_count"], skim["file_size"])
+    skim_info = make_skim_info(
+        skim["skim_dir"], skim["file_count"], skim["file_size"], int(round(events)), skim["files"], skim["site"]
+    )
+    skim_info["event_count_error"] = int(math.ceil(error))
+    skim_info["sampled_files"] = len(skim["samples"])
+    return skim_info
+
+
+def make_skim_info(skim_dir, file_count, file_size, event_count, files=None, site=None):
+    """Create the information on a skim as digested by formatters"""
     skim_info = {
         "path": {
-            socket.gethostname()[:3].upper(): skim_dir
+            site or socket.gethostname()[:3].upper(): skim_dir
         },
-        "file_count": len(glob.glob(os.path.join(skim_dir, "*.root"))),
-        "file_size": sum(os.path.getsize(filename) for filename in glob.glob(os.path.join(skim_dir, "*.root"))),
-        "event_count": sum(get_event_count(filename) for filename in glob.glob(os.path.join(skim_dir, "*.root")))
+        "file_count": file_count,
+        "file_size": file_size,
+        "event_count": event_count,
     }
+    if files is not None:
+        skim_info["files"] = files
     return skim_info
 
-if __name__ == "__main__":
-    args = CLI.parse_args()
+
+def make_file_info(file_path, size, mtime, event_count):
+    """Create the information on a file of a skim"""
+    return {"name": os.path.basename(file_path), "size": size, "mtime": mtime, "event_count": event_count}
+
+
+class SkimInventory(object):
+    """
+    Persistent inventory of skims and their files
+
+    The size, modification time and event count of every file are stored. On
+    an update, a skim is only listed again if the modification time of its
+    directory changed, and only the events of new or changed files are counted.
+
+    :param inventory_path: path of the SQLite database storing the inventory
+    :type inventory_path: str
+
+    :note: Files overwritten in place do not change the modification time of
+           their directory. Use ``refresh`` to update such skims.
+    """
+    def __init__(self, inventory_path):
+        self.inventory_path = inventory_path
+        self._db = sqlite3.connect(inventory_path, timeout=60)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS skims ("
+                "path TEXT PRIMARY KEY, mtime REAL, file_count INTEGER, file_size INTEGER, event_count INTEGER)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "skim TEXT, name TEXT, size INTEGER, mtime REAL, event_count INTEGER, PRIMARY KEY (skim, name))"
+            )
+
+    def update(self, skim_dirs, counter_options=None, pool=None, refresh=False):
+        """
+        Update the inventory of skims
+
+        Skims are listed as they are found, and the new or changed files of all
+        skims are counted in a single queue, largest files first, see
+        :py:func:`~._count_tasks`. Each skim is stored as soon as all its
+        files are counted.
+
+        :param skim_dirs: directories containing the skim files
+        :type skim_dirs: iterable[str]
+        :param counter_options: keyword arguments to :py:func:`~utility.event_count.get_counter`
+        :type counter_options: dict or None
+        :param pool: process pool for counting the events of files in parallel
+        :type pool: :py:class:`multiprocessing.pool.Pool` or None
+        :param refresh: list skims even if their directory is unchanged
+        :type refresh: bool
+        :return: directories of all skims, changed or not
+        :rtype: list[str]
+        """
+        found_dirs, skims = [], {}
+        # tasks may be created by a thread of the pool while results are stored
+        reader = sqlite3.connect(self.inventory_path, timeout=60, check_same_thread=False)
+
+        def skim_tasks():
+            for skim_dir in skim_dirs:
+                skim_dir = os.path.abspath(skim_dir)
+                found_dirs.append(skim_dir)
+                dir_mtime = os.stat(skim_dir).st_mtime
+                record = reader.execute("SELECT mtime FROM skims WHERE path = ?", (skim_dir,)).fetchone()
+                if not refresh and record is not None and record[0] == dir_mtime:
+                    logger.log(3, "skim unchanged %s", skim_dir)
+                    continue
+                logger.log(2, "updating inventory of skim %s", skim_dir)
+                known_files = dict(
+                    (name, (size, mtime, count)) for name, size, mtime, count in reader.execute(
+                        "SELECT name, size, mtime, event_count FROM files WHERE skim = ?", (skim_dir,)
+                    ).fetchall()
+                )
+                file_records, changed_files = [], []
+                for file_path, file_stat in list_skim_files(skim_dir):
+                    name = os.path.basename(file_path)
+                    known = known_files.get(name)
+                    if known is not None and known[:2] == (file_stat.st_size, file_stat.st_mtime):
+                        file_records.append((skim_dir, name, file_stat.st_size, file_stat.st_mtime, known[2]))
+                    else:
+                        changed_files.append((file_path, file_stat))
+                skims[skim_dir] = {"mtime": dir_mtime, "pending": len(changed_files), "files": file_records}
+                if not changed_files:
+                    yield _PLACEHOLDER_SIZE, ((skim_dir, None), None, counter_options)
+                for file_path, file_stat in changed_files:
+                    file_key = (skim_dir, (os.path.basename(file_path), file_stat.st_size, file_stat.st_mtime))
+                    yield file_stat.st_size, (file_key, file_path, counter_options)
+
+        try:
+            for (skim_dir, file_record), events in _count_tasks(skim_tasks(), pool):
+                skim = skims[skim_dir]
+                if file_record is not None:
+                    skim["files"].append((skim_dir,) + file_record + (events,))
+                    skim["pending"] -= 1
+                if not skim["pending"]:
+                    del skims[skim_dir]
+                    self._store(skim_dir, skim["mtime"], skim["files"])
+        finally:
+            reader.close()
+        return found_dirs
+
+    def _store(self, skim_dir, dir_mtime, file_records):
+        with self._db:
+            self._db.execute("DELETE FROM files WHERE skim = ?", (skim_dir,))
+            self._db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?)", file_records)
+            self._db.execute("INSERT OR REPLACE INTO skims VALUES (?, ?, ?, ?, ?)", (
+                skim_dir, dir_mtime, len(file_records),
+                sum(record[2] for record in file_records), sum(record[4] for record in file_records)
+            ))
+
+    def remove_missing(self, datapath, skim_dirs):
+        """
+        Remove all skims below a path which are not in ``skim_dirs``
+
+        A skim is only removed if its directory no longer exists or no longer
+        contains skim files. Skims which could not be listed, e.g. due to a
+        transient failure of the storage, are kept with their files.
+
+        :param datapath: basepath of the skims
+        :type datapath: str
+        :param skim_dirs: directories of all existing skims below ``datapath``
+        :type skim_dirs: iterable[str]
+        """
+        skim_dirs = set(os.path.abspath(skim_dir) for skim_dir in skim_dirs)
+        missing = [
+            (skim_dir,) for skim_dir in self.skim_dirs(datapath)
+            if skim_dir not in skim_dirs and _skim_dir_gone(skim_dir)
+        ]
+        with self._db:
+            self._db.executemany("DELETE FROM files WHERE skim = ?", missing)
+            self._db.executemany("DELETE FROM skims WHERE path = ?", missing)
+
+    def skim_dirs(self, datapath):
+        """Get the directories of all skims below a path"""
+        datapath = os.path.abspath(datapath)
+        return [
+            path for path, in self._db.execute("SELECT path FROM skims ORDER BY path")
+            if path == datapath or path.startswith(datapath.rstrip(os.sep) + os.sep)
+        ]
+
+    def skim_infos(self, datapath, file_details=False, site=None):
+        """
+        Get the information on all skims below a path
+
+        :param datapath: basepath of the skims
+        :type datapath: str
+        :param file_details: include the information on each file of a skim
+        :type file_details: bool
+        :param site: name of the site storing the skims
+        :type site: str or None
+        :rtype: iterable[dict]
+        """
+        datapath = os.path.abspath(datapath)
+        for path, file_count, file_size, events in self._db.execute(
+                "SELECT path, file_count, file_size, event_count FROM skims ORDER BY path").fetchall():
+            if path == datapath or path.startswith(datapath.rstrip(os.sep) + os.sep):
+                files = None
+                if file_details:
+                    files = [
+                        make_file_info(name, size, mtime, count)
+                        for name, size, mtime, count in self._db.execute(
+                            "SELECT name, size, mtime, event_count FROM files WHERE skim = ? ORDER BY name", (path,)
+                        )
+                    ]
+                yield make_skim_info(
+                    path, file_count=file_count, file_size=file_size, event_count=events, files=files, site=site
+                )
+
+
+def _skim_dir_gone(skim_dir):
+    """Check whether a directory is known to no longer contain a skim"""
+    try:
+        dir_names = os.listdir(skim_dir)
+    except OSError as err:
+        return err.errno == errno.ENOENT
+    return not any(not name.startswith(".") and fnmatch.fnmatch(name, "*.root") for name in dir_names)
+
+
+class SnapshotWriter(object):
+    """
+    Write the skims found at a site to a snapshot for :py:func:`~.merge_snapshots`
+
+    Each skim is written as a line of JSON, including its path relative to
+    the datapath it was found in and the name and size of its files.
+
+    :param snapshot_path: path of the snapshot file
+    :type snapshot_path: str
+    :param site: name of the site storing the skims
+    :type site: str
+    :param datapaths: basepaths in which skims were searched
+    :type datapaths: list[str]
+    """
+    def __init__(self, snapshot_path, site, datapaths):
+        self.site = site
+        # match skims to the most specific datapath
+        self.datapaths = sorted((os.path.abspath(datapath) for datapath in datapaths), key=len, reverse=True)
+        self._file = open(snapshot_path + ".part", "w")
+        self._snapshot_path = snapshot_path
+
+    def _relpath(self, skim_dir):
+        for datapath in self.datapaths:
+            if skim_dir == datapath or skim_dir.startswith(datapath.rstrip(os.sep) + os.sep):
+                return os.path.relpath(skim_dir, datapath)
+        return skim_dir
+
+    def write(self, skim_info):
+        skim_dir = os.path.abspath(skim_info["path"][self.site])
+        record = dict(skim_info)
+        record.update(site=self.site, path=skim_dir, relpath=self._relpath(skim_dir))
+        self._file.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def close(self):
+        """Complete the snapshot, replacing any previous one"""
+        self._file.close()
+        os.rename(self._snapshot_path + ".part", self._snapshot_path)
+
+
+def merge_snapshots(snapshot_paths, file_details=False):
+    """
+    Merge the skims of snapshots from several sites
+
+    Skims at different sites are merged if they have the same path relative
+    to their datapath, and files of the same names and sizes. Skims which
+    differ between sites are reported separately for each site.
+
+    :param snapshot_paths: paths of snapshots written by :py:class:`~.SnapshotWriter`
+    :type snapshot_paths: list[str]
+    :param file_details: include the information on each file of a skim
+    :type file_details: bool
+    :return: information on each skim, ordered by relative path
+    :rtype: iterable[dict]
+    """
+    skims = {}
+    for snapshot_path in snapshot_paths:
+        with open(snapshot_path) as snapshot:
+            for line in snapshot:
+                record = json.loads(line)
+                file_set = tuple(sorted((file_info["name"], file_info["size"]) for file_info in record["files"]))
+                skims.setdefault((record["relpath"], file_set), []).append(record)
+    relpath_count = collections.Counter(relpath for relpath, _ in skims)
+    for (relpath, _), records in sorted(skims.items()):
+        if relpath_count[relpath] > 1:
+            logger.warning("skim %s at %s differs from other sites", relpath, ", ".join(record["site"] for record in records))
+        # prefer exact counts over estimates
+        records.sort(key=lambda record: "event_count_error" in record)
+        skim_info = dict(
+            (key, value) for key, value in records[0].items()
+            if key not in ("site", "relpath", "files") or (key == "files" and file_details)
+        )
+        skim_info["path"] = dict((record["site"], record["path"]) for record in records)
+        yield skim_info
+
+
+def configure_logging(verbosity):
+    """
+    Log messages to stderr depending on the verbosity
+
+    :note: Importing :py:mod:`utility.exceptions`, e.g. via
+           :py:mod:`utility.event_count`, already configures logging. This
+           would turn :py:func:`logging.basicConfig` into a no-op.
+    """
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
     logging.basicConfig(
         format="%(message)s",
         stream=sys.stderr,
-        level=5-args.verbosity,
+        level=5-verbosity,
     )
+
+
+if __name__ == "__main__":
+    args = CLI.parse_args()
+    if args.estimate is not None and args.inventory is not None:
+        CLI.error("argument --estimate: not allowed with argument --inventory")
+    if args.merge is not None and (args.datapath or args.export is not None):
+        CLI.error("argument --merge: not allowed with DATAPATH or --export")
+    configure_logging(args.verbosity)
     formatter = formatter_factory(args.formatter)
-    for datapath in args.datapath:
-        for skim_dir in find_skims_dirs(datapath):
-            formatter.digest(collect_skim_info(skim_dir))
+    counter_options = {
+        "backend": args.backend, "cache": args.cache, "cache_path": args.cache_path, "refresh": args.refresh
+    }
+    # ROOT is not thread-safe, use processes instead
+    pool = multiprocessing.Pool(args.jobs) if args.jobs > 1 else None
+    inventory = SkimInventory(args.inventory) if args.inventory is not None else None
+    snapshot = SnapshotWriter(args.export, args.site, args.datapath) if args.export is not None else None
+    # snapshots must list files to match skims across sites
+    file_details = formatter.file_details or snapshot is not None
+
+    def digest(skim_info):
+        if snapshot is not None:
+            snapshot.write(skim_info)
+        if not formatter.file_details:
+            skim_info.pop("files", None)
+        formatter.digest(skim_info)
+
+    try:
+        with formatter:
+            if args.merge is not None:
+                for skim_info in merge_snapshots(args.merge, file_details=formatter.file_details):
+                    formatter.digest(skim_info)
+            elif inventory is None:
+                skim_dirs = itertools.chain.from_iterable(
+                    find_skims_dirs(datapath, workers=args.list_workers) for datapath in args.datapath
+                )
+                for skim_info in collect_skims_info(
+                        skim_dirs, counter_options=counter_options, pool=pool, file_details=file_details,
+                        estimate=args.estimate, min_files=args.estimate_min_files, seed=args.seed, site=args.site):
+                    digest(skim_info)
+            else:
+                skim_dirs = inventory.update(
+                    itertools.chain.from_iterable(
+                        find_skims_dirs(datapath, workers=args.list_workers) for datapath in args.datapath
+                    ),
+                    counter_options=counter_options, pool=pool, refresh=args.refresh,
+                )
+                for datapath in args.datapath:
+                    inventory.remove_missing(datapath, skim_dirs)
+                # skims are cheap to read again from the inventory instead of holding them
+                for datapath in args.datapath:
+                    for skim_info in inventory.skim_infos(datapath, site=args.site):
+                        formatter.measure(skim_info)
+                for datapath in args.datapath:
+                    for skim_info in inventory.skim_infos(datapath, file_details=file_details, site=args.site):
+                        digest(skim_info)
+        if snapshot is not None:
+            snapshot.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
 
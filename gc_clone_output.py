@@ -17,8 +17,59 @@ example, if a job writes to a site's dCache which is locally mounted on the
 submit host, ``--source-storage /pnfs/foo/bar`` can often be used to access the
 files without grid tools.
 
+At the end of a task, the output of many jobs can be cloned at once by running
+the app manually in batch mode. All files of the selected jobs are then sent
+with a single call of the copy command, using ``rsync --files-from``::
+
+  gc_clone_output.py --workdir /gc/work.skim --jobs 0-4999 analysis_host:/remote/skim/storage
+
+In batch mode, the meta information of jobs is cached in the workdir, so that
+repeated batch runs only read the files of new or changed jobs.
+
+On busy submit hosts, transfers in the hook stall the grid-control monitoring
+loop. With ``--spool``, the hook only appends the resolved paths of a job to a
+spool file in the workdir and returns immediately. A separate drainer process
+transfers the spooled jobs in batches::
+
+  [events]
+  on output = gc_clone_output.py --spool analysis_host:/remote/skim/storage
+
+  $ gc_clone_output.py --workdir /gc/work.skim --drain --workers 4
+
+Output may be cloned to several destinations at once by passing multiple
+``dest_storage`` arguments. Transfers to all destinations are run concurrently,
+with at most ``--workers`` copy commands in total and ``--host-workers`` copy
+commands to the same remote host. The latter avoids running into connection
+limits of the remote ``sshd``.
+
+With ``--ledger``, every successful transfer is recorded in a ledger in the
+workdir. Files already present in the ledger are not transferred again, for
+example when a job output is hooked repeatedly or a batch is restarted. For
+locally accessible sources, a file is only skipped if its size and
+modification time, and with ``--ledger-checksum`` also its adler32 checksum,
+are unchanged. The checksum stored by dCache is used if the source is on a
+dCache NFS mount; otherwise, the file is read once to compute it.
+
+Failed transfers are retried ``--retries`` times if the copy command exits
+with a transient error, such as a network or timeout failure of ``rsync``.
+Retries wait for an exponentially growing, randomized time starting at
+``--retry-backoff`` seconds. With the default ``rsync -P``, partially
+transferred files are kept and resumed by the retry. Transfers which fail
+permanently are recorded in the workdir, and can be repeated later using
+``--retry-failed``.
+
+If both source and destination are locally mounted, ``--copy-via native``
+copies files without spawning any external command. The native copy creates
+missing destination directories and preserves permissions and timestamps.
+
+With ``--stats``, the duration of reading job meta information and of each
+transfer as well as the number of files, bytes and retries are logged to a
+JSON-lines file in the workdir. The percentiles and aggregate throughput of
+all logged transfers of a task are reported by ``--summarize``.
+
 :note: Most transfer protocols require the remote directory to exist. There is
-       currently no way have the app create the remote directory implicitly.
+       currently no way have the app create the remote directory implicitly,
+       except for the ``native`` copy to local destinations.
 
 **Arguments**
 
@@ -28,16 +79,29 @@ files without grid tools.
 """
 # standard library imports
 import argparse
+import errno
+import functools
+import glob
+import itertools
+import json
+import multiprocessing.pool
 import os
+import random
+import shutil
+import sqlite3
 import subprocess
 import sys
+import tempfile
+import threading
 import time
+import zlib
 
 # third party imports
 
 # application/library imports
 import py_compat
 import gc_tools.gc_job
+from utility.formatting import nice_bytes
 
 CLI = argparse.ArgumentParser(
     formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -54,7 +118,18 @@ CLI = argparse.ArgumentParser(
 )
 CLI.add_argument(
     "dest_storage",
-    help="base path of data destination",
+    nargs="*",
+    help="base path(s) of data destination",
+)
+CLI.add_argument(
+    "--workdir",
+    default=os.environ.get("GC_WORKDIR"),
+    help="GC working directory. [$GC_WORKDIR]",
+)
+CLI.add_argument(
+    "--jobs",
+    help="clone the output of several jobs in one transfer, e.g. '0-99,120'."
+         " Use 'all' for every job in the workdir. [$GC_MY_JOBID]",
 )
 CLI.add_argument(
     "--source-storage",
@@ -75,38 +150,831 @@ CLI.add_argument(
 CLI.add_argument(
     "--copy-via",
     nargs=argparse.REMAINDER,
-    help="command(s) to use for copying. Default: %(default)s",
+    help="command(s) to use for copying, or 'native' to copy between local"
+         " paths without external commands. Default: %(default)s",
     default=["rsync", "-aPp", "--relative"],
 )
+CLI_SPOOL = CLI.add_argument_group("spooling")
+CLI_SPOOL.add_argument(
+    "--spool",
+    action="store_true",
+    help="queue the output in the workdir spool instead of transferring it",
+)
+CLI_SPOOL.add_argument(
+    "--drain",
+    action="store_true",
+    help="transfer the output queued in the workdir spool",
+)
+CLI_SPOOL.add_argument(
+    "--drain-interval",
+    type=float,
+    default=30,
+    help="seconds between draining the spool, or 0 to drain once. [%(default)s]",
+)
+CLI_SPOOL.add_argument(
+    "--batch-size",
+    type=int,
+    default=1000,
+    help="maximum number of jobs transferred by one copy command. [%(default)s]",
+)
+CLI_CONCURRENCY = CLI.add_argument_group("concurrency")
+CLI_CONCURRENCY.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="maximum number of concurrent copy commands. [%(default)s]",
+)
+CLI_CONCURRENCY.add_argument(
+    "--host-workers",
+    type=int,
+    default=2,
+    help="maximum number of concurrent copy commands per remote host. [%(default)s]",
+)
+CLI_LEDGER = CLI.add_argument_group("ledger")
+CLI_LEDGER.add_argument(
+    "--ledger",
+    action="store_true",
+    help="skip files recorded as transferred in the workdir ledger",
+)
+CLI_LEDGER.add_argument(
+    "--ledger-checksum",
+    action="store_true",
+    help="compare adler32 checksums of local sources against the ledger,"
+         " preferring checksums stored by dCache",
+)
+CLI_RETRY = CLI.add_argument_group("retries")
+CLI_RETRY.add_argument(
+    "--retries",
+    type=int,
+    default=2,
+    help="maximum number of retries after transient errors. [%(default)s]",
+)
+CLI_RETRY.add_argument(
+    "--retry-backoff",
+    type=float,
+    default=5,
+    help="initial waiting time in seconds before retrying. [%(default)s]",
+)
+CLI_RETRY.add_argument(
+    "--retry-failed",
+    action="store_true",
+    help="repeat all transfers recorded as failed in the workdir",
+)
+CLI_STATS = CLI.add_argument_group("statistics")
+CLI_STATS.add_argument(
+    "--stats",
+    action="store_true",
+    help="log the duration, size and retries of transfers to the workdir",
+)
+CLI_STATS.add_argument(
+    "--summarize",
+    action="store_true",
+    help="report statistics of all transfers logged in the workdir",
+)
 
-def vprint(job_meta, message):
-    print time.strftime("%Y-%m-%d %H:%M:%S"), "-", "Job", "%-4d" % job_meta.job_id, message
+#: name of the spool file in the GC workdir
+SPOOL_NAME = "gc_clone_output.spool"
+#: name of the ledger database in the GC workdir
+LEDGER_NAME = "gc_clone_output.ledger"
+#: name of the transfer statistics log in the GC workdir
+STATS_NAME = "gc_clone_output.stats"
+#: name of the record of failed transfers in the GC workdir
+FAILED_NAME = "gc_clone_output.failed"
+#: value of ``--copy-via`` selecting :py:func:`native_copy`
+NATIVE_COPY_VIA = ["native"]
+#: exit codes of ``rsync`` for errors that may vanish when retrying
+#: (not 22 and 23, which also cover missing sources and denied permissions)
+TRANSIENT_EXIT_CODES = (5, 10, 11, 12, 14, 21, 24, 30, 35, 255)
 
+def vprint(job_id, message):
+    print time.strftime("%Y-%m-%d %H:%M:%S"), "-", "Job", "%-4d" % job_id, message
 
-if __name__ == "__main__":
-    args = CLI.parse_args()
-    # read job meta information
-    gc_job_meta = gc_tools.gc_job.GCJobMeta(os.environ["GC_WORKDIR"], os.environ["GC_MY_JOBID"])
-    if gc_job_meta.exitcode != 0:
-        if args.verbose:
-            vprint(gc_job_meta, "output cloning SKIPPED")
-        sys.exit(0)
-    # joining with '.' to file name allows rsync to create containing directories
-    source_path = os.path.join(
-        (args.source_storage or gc_job_meta.environ["SE_OUTPUT_PATH"]),
-        '.',
-        (args.file_names or gc_job_meta.environ["SE_OUTPUT_PATTERN"])
+
+def parse_job_ids(job_spec, workdir):
+    """
+    Expand a job specification to individual job IDs
+
+    :param job_spec: comma separated job IDs and ranges, e.g. ``0-4,7``, or ``all``
+    :type job_spec: str
+    :param workdir: GC working directory to scan for ``all`` jobs
+    :type workdir: str
+    :return: job IDs in ascending order
+    :rtype: list[int]
+    """
+    if job_spec == "all":
+        return gc_tools.gc_job.GCTask(workdir).job_ids
+    job_ids = set()
+    for element in job_spec.split(","):
+        first, _, last = element.partition("-")
+        job_ids.update(xrange(int(first), int(last or first) + 1))
+    return sorted(job_ids)
+
+
+def job_source(job_meta, source_storage=None, file_names=None):
+    """
+    Get the base path and relative file path of a job's output
+
+    :param job_meta: meta information of the job
+    :type job_meta: :py:class:`~gc_tools.gc_job.GCJobMeta`
+    :param source_storage: overwrite for the base path (``$SE_OUTPUT_PATH``)
+    :type source_storage: str or None
+    :param file_names: overwrite for the file names (``$SE_OUTPUT_PATTERN``)
+    :type file_names: str or None
+    :return: base path and file path relative to it
+    :rtype: tuple[str, str]
+    """
+    return (
+        source_storage or job_meta.environ["SE_OUTPUT_PATH"],
+        file_names or job_meta.environ["SE_OUTPUT_PATTERN"],
+    )
+
+
+class TransferLedger(object):
+    """
+    Persistent record of files already cloned to a destination
+
+    Files are identified by their source path and destination. If the source
+    is locally accessible, the job ID, size and modification time as well as
+    the adler32 checksum (if ``checksum`` is set) must match the recorded
+    transfer for a file to count as transferred. The checksum is taken from
+    dCache if available, and otherwise computed at most once per transfer.
+
+    :param ledger_path: path of the SQLite database storing the ledger
+    :type ledger_path: str
+    :param checksum: compare adler32 checksums of local sources
+    :type checksum: bool
+    """
+    def __init__(self, ledger_path, checksum=False):
+        self.checksum = checksum
+        self._lock = threading.Lock()
+        # fingerprints of files checked but not yet recorded
+        self._fingerprints = {}
+        self._db = sqlite3.connect(ledger_path, timeout=60, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transfers ("
+                "source TEXT, dest TEXT, job_id INTEGER, size INTEGER, mtime REAL, adler32 INTEGER,"
+                " PRIMARY KEY (source, dest))"
+            )
+
+    def _fingerprint(self, source_path):
+        """Get the size, mtime and checksum of a source, if locally available"""
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            return None, None, None
+        fingerprint = self._fingerprints.get(source_path)
+        if fingerprint is not None and fingerprint[:2] == (stat.st_size, stat.st_mtime):
+            return fingerprint
+        adler32 = None
+        if self.checksum:
+            adler32 = dcache_adler32(source_path)
+            if adler32 is None:
+                adler32 = file_adler32(source_path)
+        fingerprint = self._fingerprints[source_path] = (stat.st_size, stat.st_mtime, adler32)
+        return fingerprint
+
+    def is_transferred(self, job_id, source_path, dest_storage):
+        """Check whether a file has already been transferred to a destination"""
+        source_path = os.path.normpath(source_path)
+        with self._lock:
+            record = self._db.execute(
+                "SELECT job_id, size, mtime, adler32 FROM transfers WHERE source = ? AND dest = ?",
+                (source_path, dest_storage)
+            ).fetchone()
+        if record is None:
+            return False
+        size, mtime, adler32 = self._fingerprint(source_path)
+        if tuple(record[:3]) != (job_id, size, mtime):
+            return False
+        # records with and without checksums are valid for runs either way
+        if adler32 is None or record[3] is None or record[3] == adler32:
+            self._fingerprints.pop(source_path, None)
+            return True
+        return False
+
+    def record(self, job_id, source_path, dest_storage):
+        """Record that a file has been transferred to a destination"""
+        source_path = os.path.normpath(source_path)
+        fingerprint = self._fingerprint(source_path)
+        self._fingerprints.pop(source_path, None)
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO transfers VALUES (?, ?, ?, ?, ?, ?)",
+                    (source_path, dest_storage, job_id) + fingerprint
+                )
+
+
+def dcache_adler32(file_path):
+    """
+    Get the adler32 checksum stored by dCache for a file on its NFS mount
+
+    :return: the checksum, or ``None`` if it is not available
+    :rtype: int or None
+    """
+    dir_path, file_name = os.path.split(file_path)
+    try:
+        with open(os.path.join(dir_path, ".(get)(%s)(checksums)" % file_name)) as checksums:
+            checksum_data = checksums.read()
+    except IOError:
+        return None
+    # e.g. 'ADLER32:0a2b3c4d', possibly along with other checksum types
+    for checksum in checksum_data.replace(",", " ").split():
+        checksum_type, _, value = checksum.partition(":")
+        if checksum_type.upper() == "ADLER32":
+            try:
+                return int(value, 16)
+            except ValueError:
+                return None
+    return None
+
+
+def file_adler32(file_path):
+    """Compute the adler32 checksum of a file"""
+    adler32 = 1
+    with open(file_path, "rb") as source_file:
+        for chunk in iter(lambda: source_file.read(1024 * 1024), b""):
+            adler32 = zlib.adler32(chunk, adler32)
+    return adler32 & 0xffffffff
+
+
+class TransferStats(object):
+    """
+    Log of transfer measurements, stored as one JSON object per line
+
+    :param stats_path: path of the log file
+    :type stats_path: str
+
+    Each transfer is logged with the following fields:
+
+    - **time** start of the transfer as a UNIX timestamp
+    - **job_ids** IDs of all jobs whose output is transferred
+    - **dest** base path of data destination
+    - **files** number of files
+    - **bytes** size of all locally accessible source files, or ``null``
+    - **meta_time** seconds spent reading meta information of the jobs, or ``null``
+    - **copy_time** seconds spent transferring, including retries
+    - **retries** number of retries after transient errors
+    - **throughput** bytes per second of successful transfers, or ``null``
+    - **exit_code** ``0`` for successful transfers
+    """
+    def __init__(self, stats_path):
+        self.stats_path = stats_path
+        #: seconds spent reading meta information, by job ID
+        self.meta_times = {}
+
+    def record(self, job_ids, source_paths, dest_storage, start, end, retries, exit_code):
+        """Log a single transfer"""
+        source_paths = [path for pattern in source_paths for path in glob.glob(pattern)]
+        size = sum(os.path.getsize(path) for path in source_paths) if source_paths else None
+        meta_times = [self.meta_times[job_id] for job_id in job_ids if job_id in self.meta_times]
+        record = {
+            "time": start,
+            "job_ids": job_ids,
+            "dest": dest_storage,
+            "files": len(source_paths) or len(job_ids),
+            "bytes": size,
+            "meta_time": sum(meta_times) if meta_times else None,
+            "copy_time": end - start,
+            "retries": retries,
+            "throughput": size / (end - start) if size is not None and end > start and not exit_code else None,
+            "exit_code": exit_code,
+        }
+        spool_fd = os.open(self.stats_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(spool_fd, json.dumps(record, sort_keys=True) + "\n")
+        finally:
+            os.close(spool_fd)
+
+
+def _percentiles(values, percents=(50, 90, 99, 100)):
+    """Get the nearest-rank percentiles of values"""
+    values = sorted(values)
+    if not values:
+        return [float("nan")] * len(percents)
+    return [values[max(0, int(len(values) * percent / 100.0 + 0.5) - 1)] for percent in percents]
+
+
+def summarize_stats(stats_path):
+    """Report the statistics of all transfers logged by :py:class:`~.TransferStats`"""
+    with open(stats_path) as stats_file:
+        records = [json.loads(line) for line in stats_file if line.strip()]
+    if not records:
+        print "no transfers logged in", stats_path
+        return
+    sized_records = [record for record in records if record["bytes"] is not None]
+    total_bytes = sum(record["bytes"] for record in sized_records)
+    print "transfers: %d (%d failed), jobs: %d, files: %d, size: %s" % (
+        len(records),
+        sum(1 for record in records if record["exit_code"]),
+        sum(len(record["job_ids"]) for record in records),
+        sum(record["files"] for record in records),
+        nice_bytes(total_bytes),
     )
-    dest_path = os.path.join(
-        args.dest_storage
+    print "%-18s %10s %10s %10s %10s" % ("", "p50", "p90", "p99", "max")
+    for name, values in (
+        ("meta time [s]", [record["meta_time"] for record in records if record["meta_time"] is not None]),
+        ("copy time [s]", [record["copy_time"] for record in records]),
+        ("retries", [record["retries"] for record in records]),
+        ("throughput [MB/s]", [record["throughput"] / 1E6 for record in records if record["throughput"] is not None]),
+    ):
+        print "%-18s %10.3f %10.3f %10.3f %10.3f" % ((name,) + tuple(_percentiles(values)))
+    sized_records = [record for record in sized_records if not record["exit_code"]]
+    if sized_records:
+        total_bytes = sum(record["bytes"] for record in sized_records)
+        copy_time = sum(record["copy_time"] for record in sized_records)
+        wall_time = max(record["time"] + record["copy_time"] for record in sized_records) - min(record["time"] for record in sized_records)
+        print "aggregate: %.3f MB/s per transfer, %.3f MB/s overall" % (
+            total_bytes / 1E6 / copy_time if copy_time else float("nan"),
+            total_bytes / 1E6 / wall_time if wall_time else float("nan"),
+        )
+
+
+def dest_host(dest_storage):
+    """
+    Get the host of a destination in ``rsync`` notation
+
+    :param dest_storage: base path of data destination, e.g. ``user@host:/path``
+    :type dest_storage: str
+    :return: host of the destination, or ``""`` for local destinations
+    :rtype: str
+    """
+    if "://" in dest_storage:
+        host = dest_storage.partition("://")[2].partition("/")[0]
+    else:
+        host, sep, _ = dest_storage.partition(":")
+        if not sep or "/" in host:
+            return ""
+    return host.rpartition("@")[2].partition(":")[0]
+
+
+def run_transfers(transfers, workers=1, host_workers=None):
+    """
+    Run transfers concurrently, limiting the number of transfers per remote host
+
+    :param transfers: destination host and a callable performing each transfer
+    :type transfers: list[tuple[str, callable]]
+    :param workers: maximum number of concurrent transfers
+    :type workers: int
+    :param host_workers: maximum number of concurrent transfers per remote host
+    :type host_workers: int or None
+    :return: exit code of all transfers
+    :rtype: int
+    """
+    if not transfers:
+        return 0
+    if workers <= 1 or len(transfers) == 1:
+        return max(transfer() for _, transfer in transfers)
+    # local transfers are only limited by the number of workers
+    host_slots = dict(
+        (host, threading.BoundedSemaphore(host_workers or workers))
+        for host, _ in transfers if host
     )
-    # clone
-    output = "<no output>"
+
+    def run_transfer(host_transfer):
+        host, transfer = host_transfer
+        if not host:
+            return transfer()
+        with host_slots[host]:
+            return transfer()
+    # alternate between hosts, so that workers do not all queue for one host
+    host_transfers = {}
+    for host, transfer in transfers:
+        host_transfers.setdefault(host, []).append((host, transfer))
+    transfers = [
+        host_transfer
+        for host_transfer in itertools.chain(*itertools.izip_longest(*host_transfers.values()))
+        if host_transfer is not None
+    ]
+    pool = multiprocessing.pool.ThreadPool(min(workers, len(transfers)))
+    try:
+        return max(pool.map(run_transfer, transfers))
+    finally:
+        pool.close()
+
+
+def check_output_retry(command, retries=0, backoff=1.0, attempts=None):
+    """
+    Run a command, repeating it after transient errors
+
+    Before each retry, the command waits for ``backoff`` seconds, doubled for
+    every previous retry and randomized by up to 50%.
+
+    :param command: the command and its arguments
+    :type command: list[str]
+    :param retries: maximum number of retries
+    :type retries: int
+    :param backoff: initial waiting time in seconds before retrying
+    :type backoff: float
+    :param attempts: list to which the exit code of each failed attempt is appended
+    :type attempts: list[int] or None
+    :return: output of the command
+    :rtype: str
+    :raises subprocess.CalledProcessError: if the command fails permanently or too often
+    """
+    for attempt in itertools.count():
+        try:
+            return subprocess.check_output(command)
+        except subprocess.CalledProcessError as err:
+            if attempts is not None:
+                attempts.append(err.returncode)
+            if attempt >= retries or err.returncode not in TRANSIENT_EXIT_CODES:
+                raise
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def _copy_file(source_path, dest_path):
+    """Copy a single file including its permissions and timestamps"""
+    try:
+        os.makedirs(os.path.dirname(dest_path))
+    except OSError as err:
+        if err.errno != errno.EEXIST:
+            raise
+    # copy to a temporary file first, so that dest_path is never incomplete
+    part_path = "%s.%d.part" % (dest_path, os.getpid())
     try:
-        output = subprocess.check_output(args.copy_via + [source_path, dest_path])
-    except subprocess.CalledProcessError:
-        print(output)
-        sys.exit(1)
+        with open(source_path, "rb") as source_file:
+            with open(part_path, "wb") as dest_file:
+                shutil.copyfileobj(source_file, dest_file, 16 * 1024 * 1024)
+                source_size = os.fstat(source_file.fileno()).st_size
+                dest_size = dest_file.tell()
+        if dest_size != source_size:
+            raise IOError(
+                errno.EIO, "Incomplete copy of %d of %d bytes" % (dest_size, source_size), source_path
+            )
+        shutil.copystat(source_path, part_path)
+        os.rename(part_path, dest_path)
+    except BaseException:
+        try:
+            os.unlink(part_path)
+        except OSError:
+            pass
+        raise
+
+
+def native_copy(source_base, file_names, dest_storage):
+    """
+    Copy files between locally mounted storages without external commands
+
+    File names are expanded as globs relative to ``source_base``. Each file is
+    copied to the same relative path below ``dest_storage``, creating any
+    missing directories. Files are copied one after another; concurrent
+    copies are run by :py:func:`~.run_transfers`.
+
+    :param source_base: base path of all files
+    :type source_base: str
+    :param file_names: paths of files relative to ``source_base``
+    :type file_names: list[str]
+    :param dest_storage: base path of data destination
+    :type dest_storage: str
+    :raises EnvironmentError: if any file is missing or cannot be copied
+    """
+    copies = []
+    for file_name in file_names:
+        source_paths = glob.glob(os.path.join(source_base, file_name))
+        if not source_paths:
+            raise IOError(errno.ENOENT, "No such file", os.path.join(source_base, file_name))
+        copies.extend(
+            (source_path, os.path.join(dest_storage, os.path.relpath(source_path, source_base)))
+            for source_path in source_paths
+        )
+    for source_path, dest_path in copies:
+        _copy_file(source_path, dest_path)
+
+
+def transfer_failed(args, job_files, err):
+    """Report failed transfers and record them for :py:func:`retry_failed`"""
+    if isinstance(err, subprocess.CalledProcessError):
+        print(getattr(err, "output", None) or "<no output>")
+        reason = "exit code %d" % err.returncode
     else:
+        reason = str(err)
+    for job_id, _, _, dest_storage in job_files:
+        vprint(job_id, "output cloning FAILED (%s) to %s" % (reason, dest_storage))
+    if args.workdir is not None:
+        spool_jobs(os.path.join(args.workdir, FAILED_NAME), job_files)
+
+
+def clone_single(args, job_id, source_base, file_name, dest_storage, ledger=None, stats=None):
+    """Clone the output of a single job"""
+    # joining with '.' to file name allows rsync to create containing directories
+    source_path = os.path.join(source_base, '.', file_name)
+    start, attempts = time.time(), []
+    try:
+        if args.copy_via == NATIVE_COPY_VIA:
+            native_copy(source_base, [file_name], dest_storage)
+        else:
+            check_output_retry(
+                args.copy_via + [source_path, dest_storage],
+                retries=args.retries, backoff=args.retry_backoff, attempts=attempts
+            )
+    except (subprocess.CalledProcessError, EnvironmentError) as err:
+        if stats is not None:
+            stats.record([job_id], [source_path], dest_storage, start, time.time(), max(len(attempts) - 1, 0), 1)
+        transfer_failed(args, [(job_id, source_base, file_name, dest_storage)], err)
+        return 1
+    else:
+        if stats is not None:
+            stats.record([job_id], [source_path], dest_storage, start, time.time(), len(attempts), 0)
+        if ledger is not None:
+            ledger.record(job_id, source_path, dest_storage)
         if args.verbose:
-            vprint(gc_job_meta, "output cloning SUCCESS")
+            vprint(job_id, "output cloning SUCCESS")
+    return 0
+
+
+def transfer_files(copy_via, source_base, file_names, dest_storage, retries=0, backoff=1.0, attempts=None):
+    """
+    Transfer files relative to a common base path with one copy command
+
+    :param copy_via: copy command, which must understand ``--files-from``, or
+                     :py:data:`~.NATIVE_COPY_VIA` to use :py:func:`~.native_copy`
+    :type copy_via: list[str]
+    :param source_base: base path of all files
+    :type source_base: str
+    :param file_names: paths of files relative to ``source_base``
+    :type file_names: list[str]
+    :param dest_storage: base path of data destination
+    :type dest_storage: str
+    :param retries: maximum number of retries after transient errors
+    :type retries: int
+    :param backoff: initial waiting time in seconds before retrying
+    :type backoff: float
+    :param attempts: list to which the exit code of each failed attempt is appended
+    :type attempts: list[int] or None
+    :return: output of the copy command
+    :rtype: str
+    :raises subprocess.CalledProcessError: if the copy command fails
+    :raises EnvironmentError: if the native copy fails
+    """
+    if copy_via == NATIVE_COPY_VIA:
+        native_copy(source_base, file_names, dest_storage)
+        return ""
+    with tempfile.NamedTemporaryFile(prefix="gc_clone_output.", suffix=".files") as files_from:
+        files_from.write("".join("%s\n" % file_name for file_name in file_names))
+        files_from.flush()
+        return check_output_retry(
+            copy_via + ["--files-from=%s" % files_from.name, source_base.rstrip("/") + "/", dest_storage],
+            retries=retries,
+            backoff=backoff,
+            attempts=attempts,
+        )
+
+
+def clone_jobs(args, job_files, ledger=None, stats=None):
+    """
+    Clone the output of several jobs with one copy command
+
+    :param job_files: source base path, destination and ``(job_id, file_name)`` pairs
+    :type job_files: tuple[str, str, list[tuple[int, str]]]
+    :param ledger: ledger to record successful transfers in
+    :type ledger: :py:class:`~.TransferLedger` or None
+    :param stats: log to record the transfer in
+    :type stats: :py:class:`~.TransferStats` or None
+    :return: exit code of the transfer
+    :rtype: int
+    """
+    source_base, dest_storage, job_file_names = job_files
+    start, attempts = time.time(), []
+    try:
+        transfer_files(
+            args.copy_via, source_base, [file_name for _, file_name in job_file_names], dest_storage,
+            retries=args.retries, backoff=args.retry_backoff, attempts=attempts
+        )
+    except (subprocess.CalledProcessError, EnvironmentError) as err:
+        if stats is not None:
+            stats.record(
+                [job_id for job_id, _ in job_file_names],
+                [os.path.join(source_base, file_name) for _, file_name in job_file_names],
+                dest_storage, start, time.time(), max(len(attempts) - 1, 0), 1
+            )
+        transfer_failed(
+            args,
+            [(job_id, source_base, file_name, dest_storage) for job_id, file_name in job_file_names],
+            err
+        )
+        return 1
+    else:
+        if stats is not None:
+            stats.record(
+                [job_id for job_id, _ in job_file_names],
+                [os.path.join(source_base, file_name) for _, file_name in job_file_names],
+                dest_storage, start, time.time(), len(attempts), 0
+            )
+        for job_id, file_name in job_file_names:
+            if ledger is not None:
+                ledger.record(job_id, os.path.join(source_base, file_name), dest_storage)
+            if args.verbose:
+                vprint(job_id, "output cloning SUCCESS")
+    return 0
+
+
+def clone_batch(args, job_files, ledger=None, stats=None):
+    """
+    Clone the output of many jobs with as few copy commands as possible
+
+    Jobs are grouped by their source base path and destination, and each group
+    is split into transfers of at most ``args.batch_size`` jobs. Native copies
+    are split further to spread each group across all workers.
+
+    :param job_files: ``(job_id, source_base, file_name, dest_storage)`` of each job
+    :type job_files: iterable[tuple[int, str, str, str]]
+    :param ledger: ledger of files to skip and to record successful transfers in
+    :type ledger: :py:class:`~.TransferLedger` or None
+    :param stats: log to record transfers in
+    :type stats: :py:class:`~.TransferStats` or None
+    :return: exit code of all transfers
+    :rtype: int
+    """
+    batches = {}
+    for job_id, source_base, file_name, dest_storage in job_files:
+        if ledger is not None and ledger.is_transferred(job_id, os.path.join(source_base, file_name), dest_storage):
+            if args.verbose:
+                vprint(job_id, "output cloning SKIPPED (in ledger)")
+            continue
+        batches.setdefault((source_base, dest_storage), []).append((job_id, file_name))
+    transfers = []
+    for (source_base, dest_storage), job_file_names in sorted(batches.items()):
+        batch_size = args.batch_size
+        if args.copy_via == NATIVE_COPY_VIA:
+            # native copies handle one file at a time
+            batch_size = min(batch_size, max(1, -(-len(job_file_names) // args.workers)))
+        transfers.extend(
+            (
+                dest_host(dest_storage),
+                functools.partial(
+                    clone_jobs,
+                    args,
+                    (source_base, dest_storage, job_file_names[idx:idx + batch_size]),
+                    ledger,
+                    stats
+                )
+            )
+            for idx in xrange(0, len(job_file_names), batch_size)
+        )
+    return run_transfers(transfers, workers=args.workers, host_workers=args.host_workers)
+
+
+def spool_jobs(spool_path, job_files):
+    """
+    Queue the output of jobs for transfer by :py:func:`drain_spool`
+
+    Each job is appended as a single line to ``spool_path``, which allows
+    concurrent hook calls to write to the same spool.
+
+    :param job_files: ``(job_id, source_base, file_name, dest_storage)`` of each job
+    :type job_files: iterable[tuple[int, str, str, str]]
+    """
+    spool_lines = "".join("%d\t%s\t%s\t%s\n" % job_file for job_file in job_files)
+    spool_fd = os.open(spool_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(spool_fd, spool_lines)
+    finally:
+        os.close(spool_fd)
+
+
+def read_spool(spool_data):
+    """
+    Read jobs queued by :py:func:`spool_jobs`
+
+    :param spool_data: content of a spool
+    :type spool_data: str
+    :return: ``(job_id, source_base, file_name, dest_storage)`` of each job
+    :rtype: list[tuple[int, str, str, str]]
+    """
+    job_files = []
+    for line in spool_data.splitlines():
+        job_id, source_base, file_name, dest_storage = line.split("\t")
+        job_files.append((int(job_id), source_base, file_name, dest_storage))
+    return job_files
+
+
+def drain_spool(spool_path, args, ledger=None, stats=None):
+    """
+    Transfer all jobs queued by :py:func:`spool_jobs` since the last drain
+
+    The position up to which the spool has been drained is stored alongside the
+    spool, so that a restarted drainer continues where it stopped.
+
+    :param ledger: ledger of files to skip and to record successful transfers in
+    :type ledger: :py:class:`~.TransferLedger` or None
+    :param stats: log to record transfers in
+    :type stats: :py:class:`~.TransferStats` or None
+    :return: exit code of all transfers
+    :rtype: int
+    """
+    offset_path = spool_path + ".offset"
+    try:
+        with open(offset_path) as offset_file:
+            offset = int(offset_file.read())
+    except IOError:
+        offset = 0
+    try:
+        with open(spool_path) as spool:
+            spool.seek(offset)
+            spool_data = spool.read()
+    except IOError:
+        return 0
+    # only consume complete lines, a hook may be writing right now
+    spool_data = spool_data[:spool_data.rfind("\n") + 1]
+    if not spool_data:
+        return 0
+    exit_code = clone_batch(args, read_spool(spool_data), ledger=ledger, stats=stats)
+    with open(offset_path + ".tmp", "w") as offset_file:
+        offset_file.write("%d" % (offset + len(spool_data)))
+    os.rename(offset_path + ".tmp", offset_path)
+    return exit_code
+
+
+def retry_failed(failed_path, args, ledger=None, stats=None):
+    """
+    Repeat all transfers recorded as failed by :py:func:`transfer_failed`
+
+    The record is moved aside while retrying, so that transfers failing again
+    are recorded anew. If a previous retry was interrupted, its transfers are
+    repeated instead.
+
+    :param ledger: ledger of files to skip and to record successful transfers in
+    :type ledger: :py:class:`~.TransferLedger` or None
+    :param stats: log to record transfers in
+    :type stats: :py:class:`~.TransferStats` or None
+    :return: exit code of all transfers
+    :rtype: int
+    """
+    retry_path = failed_path + ".retry"
+    if not os.path.exists(retry_path):
+        try:
+            os.rename(failed_path, retry_path)
+        except OSError:
+            return 0
+    with open(retry_path) as retry_file:
+        job_files = read_spool(retry_file.read())
+    exit_code = clone_batch(args, job_files, ledger=ledger, stats=stats)
+    os.unlink(retry_path)
+    return exit_code
+
+
+if __name__ == "__main__":
+    args = CLI.parse_args()
+    if args.summarize:
+        summarize_stats(os.path.join(args.workdir, STATS_NAME))
+        sys.exit(0)
+    ledger = TransferLedger(os.path.join(args.workdir, LEDGER_NAME), checksum=args.ledger_checksum) if args.ledger else None
+    stats = TransferStats(os.path.join(args.workdir, STATS_NAME)) if args.stats else None
+    if args.drain:
+        while True:
+            exit_code = drain_spool(os.path.join(args.workdir, SPOOL_NAME), args, ledger=ledger, stats=stats)
+            if args.drain_interval <= 0:
+                sys.exit(exit_code)
+            time.sleep(args.drain_interval)
+    if args.retry_failed:
+        sys.exit(retry_failed(os.path.join(args.workdir, FAILED_NAME), args, ledger=ledger, stats=stats))
+    if not args.dest_storage:
+        CLI.error("argument dest_storage is required unless draining the spool or retrying failed transfers")
+    # read job meta information
+    gc_job_sources = []
+    meta_cache = gc_tools.gc_job.GCJobMetaCache.for_workdir(args.workdir) if args.jobs is not None else None
+    for job_id in parse_job_ids(args.jobs or os.environ["GC_MY_JOBID"], args.workdir):
+        meta_start = time.time()
+        gc_job_meta = gc_tools.gc_job.GCJobMeta(args.workdir, job_id, cache=meta_cache)
+        try:
+            exitcode = gc_job_meta.exitcode
+        except IOError:
+            # jobs of a batch may not have finished yet
+            if args.jobs is None:
+                raise
+            exitcode = None
+        if exitcode != 0:
+            if args.verbose:
+                vprint(gc_job_meta.job_id, "output cloning SKIPPED")
+            continue
+        gc_job_sources.append((gc_job_meta.job_id,) + job_source(gc_job_meta, args.source_storage, args.file_names))
+        if stats is not None:
+            stats.meta_times[gc_job_meta.job_id] = time.time() - meta_start
+    if meta_cache is not None:
+        meta_cache.flush()
+    if not gc_job_sources:
+        sys.exit(0)
+    if args.jobs is None and not args.spool:
+        job_id, source_base, file_name = gc_job_sources[0]
+        transfers = []
+        for dest_storage in args.dest_storage:
+            if ledger is not None and ledger.is_transferred(job_id, os.path.join(source_base, file_name), dest_storage):
+                if args.verbose:
+                    vprint(job_id, "output cloning SKIPPED (in ledger)")
+                continue
+            transfers.append((
+                dest_host(dest_storage),
+                functools.partial(clone_single, args, job_id, source_base, file_name, dest_storage, ledger, stats)
+            ))
+        sys.exit(run_transfers(transfers, workers=args.workers, host_workers=args.host_workers))
+    gc_job_files = [
+        gc_job_source + (dest_storage,)
+        for gc_job_source in gc_job_sources
+        for dest_storage in args.dest_storage
+    ]
+    if args.spool:
+        spool_jobs(os.path.join(args.workdir, SPOOL_NAME), gc_job_files)
+        sys.exit(0)
+    sys.exit(clone_batch(args, gc_job_files, ledger=ledger, stats=stats))
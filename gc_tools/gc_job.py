@@ -1,14 +1,30 @@
 import os
+import re
 import ast
+import collections
+import multiprocessing.pool
+import sqlite3
+import threading
+import cPickle as pickle
+
+from utility.exceptions import AbstractError
+
+
+def _literal_or_str(value):
+    """Evaluate a literal value, falling back to the plain string"""
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value.strip()
+
 
 class GCJobMeta(object):
-    def __init__(self, workdir, job_id):
+    def __init__(self, workdir, job_id, cache=None):
         self.job_id = int(job_id)
         self.workdir = workdir
         self.output_dir = os.path.join(workdir, "output", "job_%d" % self.job_id)
-        self.environ = GCJobEnviron(self.gc_stdout)
-        self._read_cache = {
-            "job.info": {}}
+        self.environ = GCJobEnviron(self.gc_stdout, cache=cache)
+        self.info = GCJobInfo(self._outdir_filename("job.info"), cache=cache)
 
     def _outdir_filename(self, basename):
         return os.path.join(self.output_dir, basename)
@@ -23,37 +39,260 @@ class GCJobMeta(object):
 
     @property
     def exitcode(self):
+        return int(self.info["EXITCODE"])
+
+    @property
+    def status(self):
+        return self.info.get("STATUS")
+
+    @property
+    def runtime(self):
+        return self.info.get("RUNTIME")
+
+    @property
+    def wallclock(self):
+        return self.info.get("WALLCLOCK")
+
+    @property
+    def host(self):
+        return self.info.get("HOST")
+
+
+class GCTask(object):
+    """
+    Meta information on all jobs of a GC task
+
+    Jobs are discovered from the ``output`` directory of the workdir. On first
+    access, the ``job.info`` and ``gc.stdout`` of all jobs are read
+    concurrently by ``workers`` threads.
+
+    :param workdir: GC working directory
+    :type workdir: str
+    :param workers: number of threads reading job meta information
+    :type workers: int
+    :param cache: whether to use the :py:class:`~.GCJobMetaCache` of the workdir
+    :type cache: bool
+    """
+    _job_dir_re = re.compile(r"^job_(\d+)$")
+
+    def __init__(self, workdir, workers=8, cache=False):
+        self.workdir = workdir
+        self.workers = workers
+        self.cache = GCJobMetaCache.for_workdir(workdir) if cache else None
+        self._jobs = None
+
+    @property
+    def job_ids(self):
+        """IDs of all jobs with an output directory"""
         try:
-            return self._read_cache["job.info"]["EXITCODE"]
-        except KeyError:
-            with open(self._outdir_filename("job.info")) as job_info:
-                for line in job_info:
-                    if line.startswith("EXITCODE"):
-                        self._read_cache["job.info"]["EXITCODE"] = int(line.split("=", 1)[-1])
-            return self._read_cache["job.info"]["EXITCODE"]
+            dir_names = os.listdir(os.path.join(self.workdir, "output"))
+        except OSError:
+            return []
+        return sorted(
+            int(match.group(1))
+            for match in (self._job_dir_re.match(dir_name) for dir_name in dir_names)
+            if match is not None
+        )
+
+    @property
+    def jobs(self):
+        """Meta information of all jobs, by job ID"""
+        if self._jobs is None:
+            job_metas = [GCJobMeta(self.workdir, job_id, cache=self.cache) for job_id in self.job_ids]
+            if job_metas:
+                pool = multiprocessing.pool.ThreadPool(max(1, min(self.workers, len(job_metas))))
+                try:
+                    pool.map(self._read_job, job_metas)
+                finally:
+                    pool.close()
+            if self.cache is not None:
+                self.cache.flush()
+            self._jobs = dict((job_meta.job_id, job_meta) for job_meta in job_metas)
+        return self._jobs
+
+    @staticmethod
+    def _read_job(job_meta):
+        for mapping in (job_meta.info, job_meta.environ):
+            try:
+                len(mapping)
+            except IOError:
+                # job has not finished (yet)
+                pass
+
+    def _finished_jobs(self):
+        return [job_meta for _, job_meta in sorted(self.jobs.items()) if "EXITCODE" in _safe_mapping(job_meta.info)]
+
+    def by_exitcode(self):
+        """
+        Group finished jobs by their exit code
+
+        :rtype: dict[int, list[GCJobMeta]]
+        """
+        groups = {}
+        for job_meta in self._finished_jobs():
+            groups.setdefault(job_meta.exitcode, []).append(job_meta)
+        return groups
+
+    def by_environ(self, name="SE_OUTPUT_PATH"):
+        """
+        Group jobs by the value of a variable in their environment
+
+        :param name: name of the environment variable
+        :type name: str
+        :rtype: dict[object, list[GCJobMeta]]
+        """
+        groups = {}
+        for _, job_meta in sorted(self.jobs.items()):
+            environ = _safe_mapping(job_meta.environ)
+            if name in environ:
+                groups.setdefault(environ[name], []).append(job_meta)
+        return groups
+
+    def total_runtime(self):
+        """Sum of the runtime of all jobs reporting it"""
+        return sum(
+            job_meta.runtime for job_meta in self.jobs.values()
+            if _safe_mapping(job_meta.info).get("RUNTIME") is not None
+        )
+
+
+def _safe_mapping(mapping):
+    """Get a mapping, or an empty one if its file is not readable"""
+    try:
+        len(mapping)
+    except IOError:
+        return {}
+    return mapping
 
-class GCJobEnviron(object):
+
+class GCJobMetaCache(object):
     """
-    Interface to the environment available in a job
+    Persistent cache of parsed job meta information files
+
+    The content of parsed files is stored by path, and reused as long as size
+    and modification time of the file are unchanged. Content parsed anew is
+    only written to disk by :py:meth:`flush`.
+
+    :param cache_path: path of the SQLite database storing the cache
+    :type cache_path: str
+    """
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._pending = []
+        self._db = sqlite3.connect(cache_path, timeout=60, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, data BLOB)"
+            )
+
+    @classmethod
+    def for_workdir(cls, workdir):
+        """Get the cache of a GC working directory"""
+        return cls(os.path.join(workdir, "gc_job_meta.cache"))
+
+    def load(self, path, stat):
+        """Get the parsed content of a file, or ``None`` if it is not cached"""
+        with self._lock:
+            record = self._db.execute(
+                "SELECT size, mtime, data FROM files WHERE path = ?", (os.path.abspath(path),)
+            ).fetchone()
+        if record is None or (record[0], record[1]) != (stat.st_size, stat.st_mtime):
+            return None
+        return pickle.loads(str(record[2]))
+
+    def store(self, path, stat, data):
+        """Add the parsed content of a file to the cache"""
+        with self._lock:
+            self._pending.append((
+                os.path.abspath(path), stat.st_size, stat.st_mtime,
+                sqlite3.Binary(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+            ))
+
+    def flush(self):
+        """Write all content added to the cache to disk"""
+        with self._lock:
+            if self._pending:
+                with self._db:
+                    self._db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", self._pending)
+                self._pending = []
+
+
+class _LazyFileMapping(collections.Mapping):
+    """
+    Immutable mapping read from a file in a single pass on first access
+
+    :param path: path of the file to read
+    :type path: str
+    :param cache: cache to look up and store the parsed file in
+    :type cache: :py:class:`~.GCJobMetaCache` or None
+
+    :note: Once read, lookups never access the file again. This includes
+           lookups of keys that are not in the file.
     """
-    def __init__(self, gc_stdout):
-        self._gc_stdout = gc_stdout
-        self._env_cache = {}
+    def __init__(self, path, cache=None):
+        self._path = path
+        self._cache = cache
+        self._data = None
+
+    def _parse(self, lines):
+        """Extract key-value pairs from the lines of the file"""
+        raise AbstractError
+
+    @property
+    def _items(self):
+        if self._data is None:
+            stat = None
+            if self._cache is not None:
+                try:
+                    stat = os.stat(self._path)
+                except OSError:
+                    # opening the file reports the error
+                    pass
+                else:
+                    self._data = self._cache.load(self._path, stat)
+            if self._data is None:
+                with open(self._path) as source_file:
+                    self._data = dict(self._parse(source_file))
+                if stat is not None:
+                    self._cache.store(self._path, stat, self._data)
+        return self._data
 
     def __getitem__(self, item):
-        try:
-            return self._env_cache[item]
-        except KeyError:
-            with open(self._gc_stdout) as gc_stdout:
-                for line in gc_stdout:
-                    if not line.startswith("export"):
-                        continue
-                    v_name, v_val = line[7:].split("=", 1)
-                    self._env_cache[v_name] = ast.literal_eval(v_val)
-            return self._env_cache[item]
-
-    def get(self, item, default=None):
-        try:
-            return self[item]
-        except KeyError:
-            return default
+        return self._items[item]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self._path)
+
+
+class GCJobEnviron(_LazyFileMapping):
+    """
+    Interface to the environment available in a job
+    """
+    def _parse(self, lines):
+        for line in lines:
+            if not line.startswith("export"):
+                continue
+            v_name, v_val = line[7:].split("=", 1)
+            yield v_name, _literal_or_str(v_val)
+
+
+class GCJobInfo(_LazyFileMapping):
+    """
+    Interface to the ``job.info`` status report of a job
+    """
+    def _parse(self, lines):
+        for line in lines:
+            if "=" not in line:
+                continue
+            i_name, i_val = line.split("=", 1)
+            yield i_name.strip(), _literal_or_str(i_val)
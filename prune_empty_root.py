@@ -4,10 +4,27 @@
 
 Inspects files for content, looking for any that do not contain events.
 
+Opening files on network storage is dominated by latency. With ``--jobs``,
+files are inspected by several processes in parallel; results are handled in
+the order in which they are available. Checking files starts while their
+directories are still being listed.
+
+Event counts are cached by default, see :py:class:`utility.event_count.CachedCounter`.
+Files which are unchanged since a previous run are only inspected via ``stat``.
+
+Empty files are removed in batches. With ``--manifest``, all empty files are
+first recorded in a manifest and only removed once all files are checked.
+The progress of removing them is stored alongside the manifest, and
+``--resume`` continues removing files listed by a killed run. A manifest
+with files not removed yet is only used with ``--resume``. On a dry run, no
+manifest is written. With ``--quarantine``, files are moved to a directory
+instead of being deleted. Moving only renames files and thus requires the
+directory to be on the same file system.
+
 **Requires**
 
 :py:mod:`argparse`
-:py:mod:`ROOT`
+:py:mod:`ROOT`, :py:mod:`uproot` (optional, see :py:mod:`utility.event_count`)
 
 **Arguments**
 
@@ -17,30 +34,156 @@ Inspects files for content, looking for any that do not contain events.
 """
 # standard library imports
 import argparse
-import glob
-import itertools
+import errno
+import multiprocessing
 import os
-try:
-    import ROOT
-    # suppress ROOT output
-    ROOT.PyConfig.IgnoreCommandLineOptions = True
-    ROOT.gErrorIgnoreLevel = ROOT.kError
-except ImportError:
-    ROOT = None
 
 # third party imports
 
 # application/library imports
 from utility.formatting import Progress
+from utility import event_count
+from utility.utils import iter_globs
 
-def _file_has_events(file_path, branch_name):
+def _file_has_events(file_path, branch_name, counter_options=None):
     try:
-        data = ROOT.TFile(file_path)
-        return data.Get(branch_name).GetEntries() > 0
-    except AttributeError:
+        return event_count.get_counter(**(counter_options or {})).get_entries(file_path, branch_name) > 0
+    except (KeyError, ValueError):
         # some data structure is missing
         return False
 
+
+def _check_file(file_branch_options):
+    file_path, branch_name, counter_options = file_branch_options
+    return file_path, _file_has_events(file_path, branch_name, counter_options)
+
+
+def check_files(file_paths, branch_name, jobs=1, counter_options=None):
+    """
+    Check files for events, possibly in parallel
+
+    :param file_paths: files to check
+    :type file_paths: iterable[str]
+    :param branch_name: name of the branch containing events
+    :type branch_name: str
+    :param jobs: number of processes checking files
+    :type jobs: int
+    :param counter_options: keyword arguments to :py:func:`~utility.event_count.get_counter`
+    :type counter_options: dict or None
+    :return: pairs of file path and whether the file has events, in completion order
+    :rtype: iterable[tuple[str, bool]]
+    """
+    if jobs <= 1:
+        for file_path in file_paths:
+            yield file_path, _file_has_events(file_path, branch_name, counter_options)
+        return
+    # ROOT is not thread-safe, use processes instead
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap_unordered(_check_file, ((file_path, branch_name, counter_options) for file_path in file_paths)):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def _count_files(file_paths, progress):
+    """Raise the maximum of a progress for every file discovered"""
+    for file_path in file_paths:
+        progress.maximum += 1
+        yield file_path
+
+
+def quarantine_path(file_path, quarantine):
+    """Get the path of a file moved into a quarantine directory"""
+    return os.path.join(quarantine, os.path.abspath(file_path).lstrip(os.sep))
+
+
+def remove_files(file_paths, dry_run=False, quarantine=None):
+    """
+    Remove files, or just report them on a dry run
+
+    :param file_paths: files to remove
+    :type file_paths: iterable[str]
+    :param dry_run: only report files instead of removing them
+    :type dry_run: bool
+    :param quarantine: directory to move files to instead of deleting them
+    :type quarantine: str or None
+
+    :note: Files which do not exist anymore are ignored.
+    """
+    for file_path in file_paths:
+        if quarantine is None:
+            print "rm", file_path
+        else:
+            print "mv", file_path, quarantine_path(file_path, quarantine)
+        if dry_run:
+            continue
+        try:
+            if quarantine is None:
+                os.unlink(file_path)
+            else:
+                target_path = quarantine_path(file_path, quarantine)
+                if not os.path.isdir(os.path.dirname(target_path)):
+                    os.makedirs(os.path.dirname(target_path))
+                os.rename(file_path, target_path)
+        except OSError as err:
+            # already removed by a previous, killed run
+            if err.errno != errno.ENOENT:
+                raise
+
+
+def write_manifest(manifest_path, file_paths):
+    """Append files to the manifest of files to remove"""
+    with open(manifest_path, "a") as manifest:
+        manifest.write("".join("%s\n" % file_path for file_path in file_paths))
+
+
+def _read_manifest(manifest_path):
+    """Read the position up to which files were removed and the remaining lines of a manifest"""
+    try:
+        with open(manifest_path + ".offset") as offset_file:
+            offset = int(offset_file.read())
+    except IOError:
+        offset = 0
+    try:
+        with open(manifest_path) as manifest:
+            manifest.seek(offset)
+            manifest_data = manifest.read()
+    except IOError:
+        return offset, []
+    # a killed run may have left an incomplete last line
+    return offset, manifest_data[:manifest_data.rfind("\n") + 1].splitlines(True)
+
+
+def manifest_pending(manifest_path):
+    """Check whether a manifest lists any files which have not been removed yet"""
+    return bool(_read_manifest(manifest_path)[1])
+
+
+def remove_manifest(manifest_path, batch_size=100, dry_run=False, quarantine=None):
+    """
+    Remove all files added to a manifest since the last removal
+
+    The position up to which files have been removed is stored alongside the
+    manifest, so that a restarted run continues where it stopped. On a dry
+    run, the position is not stored.
+
+    :return: position in the manifest up to which files have been removed
+    :rtype: int
+    """
+    offset_path = manifest_path + ".offset"
+    offset, manifest_lines = _read_manifest(manifest_path)
+    for idx in xrange(0, len(manifest_lines), batch_size):
+        batch_lines = manifest_lines[idx:idx + batch_size]
+        remove_files([line.rstrip("\n") for line in batch_lines], dry_run=dry_run, quarantine=quarantine)
+        offset += sum(len(line) for line in batch_lines)
+        if not dry_run:
+            with open(offset_path + ".tmp", "w") as offset_file:
+                offset_file.write("%d" % offset)
+            os.rename(offset_path + ".tmp", offset_path)
+    return offset
+
+
 CLI = argparse.ArgumentParser(
     description="Remove empty ROOT files",
     epilog="This scripts inspects files by opening them and checking whether\n"
@@ -56,6 +199,28 @@ CLI.add_argument(
     default="Events",
     help="Branch name inside the files containing relevant content",
 )
+CLI.add_argument(
+    "--backend",
+    default="auto",
+    choices=sorted(event_count.BACKENDS),
+    help="Backend for reading files [%(default)s]",
+)
+CLI.add_argument(
+    "--cache-path",
+    default=None,
+    help="Path of the event count cache [%s]" % event_count.default_cache_path(),
+)
+CLI.add_argument(
+    "--no-cache",
+    action="store_false",
+    dest="cache",
+    help="Do not use the event count cache",
+)
+CLI.add_argument(
+    "--refresh",
+    action="store_true",
+    help="Inspect all files anew, replacing their cached event counts",
+)
 CLI.add_argument(
     "-p",
     "--progress",
@@ -68,16 +233,74 @@ CLI.add_argument(
     action="store_true",
     help="Do not actually delete anything, just report",
 )
+CLI.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of processes checking files in parallel [%(default)s]",
+)
+CLI.add_argument(
+    "--batch-size",
+    type=int,
+    default=100,
+    help="Number of empty files to collect before removing them [%(default)s]",
+)
+
+CLI_REMOVAL = CLI.add_argument_group("removal")
+CLI_REMOVAL.add_argument(
+    "--manifest",
+    default=None,
+    help="Record empty files in this manifest before removing them",
+)
+CLI_REMOVAL.add_argument(
+    "--resume",
+    action="store_true",
+    help="Remove files remaining in the manifest before checking FILES",
+)
+CLI_REMOVAL.add_argument(
+    "--quarantine",
+    default=None,
+    help="Move empty files into this directory instead of deleting them",
+)
 
 if __name__ == "__main__":
-    if ROOT is None:
-        raise ImportError("Module ROOT is not available")
     args = CLI.parse_args()
-    progress = Progress(maximum=len(list(itertools.chain(*(glob.glob(cand) for cand in args.files))))) if args.progress else None
-    for file_path in itertools.chain(*(glob.glob(cand) for cand in args.files)):
-        if not _file_has_events(file_path, args.branch_name):
-            print "rm", file_path
-            if not args.dry_run:
-                os.unlink(file_path)
+    if args.resume and args.manifest is None:
+        CLI.error("argument --resume: requires --manifest")
+    if args.resume:
+        remove_manifest(args.manifest, batch_size=args.batch_size, dry_run=args.dry_run, quarantine=args.quarantine)
+    elif args.manifest is not None and manifest_pending(args.manifest):
+        CLI.error("argument --manifest: '%s' lists files not removed yet, use --resume" % args.manifest)
+    # on a dry run, files would be removed by a later --resume
+    use_manifest = args.manifest is not None and not args.dry_run
+    file_paths = iter_globs(*args.files)
+    progress = None
+    if args.progress:
+        if args.jobs <= 1:
+            file_paths = list(file_paths)
+            progress = Progress(maximum=len(file_paths))
+        else:
+            # workers check files while the remaining files are discovered
+            progress = Progress(maximum=0)
+            file_paths = _count_files(file_paths, progress)
+    counter_options = {
+        "backend": args.backend, "cache": args.cache, "cache_path": args.cache_path, "refresh": args.refresh
+    }
+    empty_files = []
+    for file_path, has_events in check_files(file_paths, args.branch_name, jobs=args.jobs, counter_options=counter_options):
+        if not has_events:
+            empty_files.append(file_path)
+            if len(empty_files) >= args.batch_size:
+                if use_manifest:
+                    write_manifest(args.manifest, empty_files)
+                else:
+                    remove_files(empty_files, dry_run=args.dry_run, quarantine=args.quarantine)
+                empty_files = []
         if progress is not None:
             progress.step()
+    if use_manifest:
+        write_manifest(args.manifest, empty_files)
+        remove_manifest(args.manifest, batch_size=args.batch_size, quarantine=args.quarantine)
+    else:
+        remove_files(empty_files, dry_run=args.dry_run, quarantine=args.quarantine)
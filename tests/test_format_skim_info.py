@@ -0,0 +1,360 @@
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import StringIO
+
+import format_skim_info
+from utility import event_count
+
+TEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_utility", "data", "events.root")
+#: events in the tree of TEST_FILE
+TEST_EVENTS = 42
+
+
+class SkimTestCase(unittest.TestCase):
+	"""Datapath with skims of copies of the test file"""
+	def setUp(self):
+		self.test_dir = tempfile.mkdtemp()
+		self.datapath = os.path.join(self.test_dir, "data")
+		os.makedirs(self.datapath)
+		self.counter_options = {"backend": "header"}
+		self._stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+
+	def tearDown(self):
+		sys.stdout = self._stdout
+		shutil.rmtree(self.test_dir)
+
+	def make_skim(self, rel_path, file_count=2):
+		skim_dir = os.path.join(self.datapath, rel_path)
+		if not os.path.isdir(skim_dir):
+			os.makedirs(skim_dir)
+		for idx in range(file_count):
+			shutil.copy(TEST_FILE, os.path.join(skim_dir, "%d.root" % idx))
+		return skim_dir
+
+
+class Test_find_skims_dirs(SkimTestCase):
+	def test_levels(self):
+		for rel_path in ("z", "b/c", "a", "b/a/x"):
+			self.make_skim(rel_path)
+		open(os.path.join(self.datapath, "b", "notes.txt"), "w").close()
+		self.assertEqual(
+			[os.path.join(self.datapath, rel_path) for rel_path in ("a", "z", "b/c", "b/a/x")],
+			list(format_skim_info.find_skims_dirs(self.datapath, workers=3)),
+			"skims of each level sorted by path"
+		)
+
+	def test_ignored(self):
+		skim_dir = self.make_skim("a")
+		open(os.path.join(self.datapath, ".hidden.root"), "w").close()
+		os.makedirs(os.path.join(self.datapath, "empty"))
+		os.symlink(skim_dir, os.path.join(self.datapath, "link"))
+		self.assertEqual([skim_dir], list(format_skim_info.find_skims_dirs(self.datapath)), "hidden files and links ignored")
+		self.assertEqual([], list(format_skim_info.find_skims_dirs(os.path.join(self.datapath, "missing"))))
+
+
+class Test_collect_skims_info(SkimTestCase):
+	def test_list_skim_files(self):
+		skim_dir = self.make_skim("a", file_count=3)
+		open(os.path.join(skim_dir, ".hidden.root"), "w").close()
+		open(os.path.join(skim_dir, "notes.txt"), "w").close()
+		os.makedirs(os.path.join(skim_dir, "sub.root"))
+		skim_files = format_skim_info.list_skim_files(skim_dir)
+		self.assertEqual([os.path.join(skim_dir, "%d.root" % idx) for idx in range(3)], [path for path, _ in skim_files])
+		self.assertEqual([os.path.getsize(TEST_FILE)] * 3, [file_stat.st_size for _, file_stat in skim_files])
+
+	def test_collect(self):
+		skim_dir = self.make_skim("a", file_count=3)
+		shutil.copy(TEST_FILE, os.path.join(skim_dir, "broken.root"))
+		with open(os.path.join(skim_dir, "broken.root"), "r+") as broken:
+			broken.write("not ROOT")
+		skim_info, = format_skim_info.collect_skims_info(
+			[skim_dir], counter_options=self.counter_options, file_details=True, site="TST"
+		)
+		self.assertEqual({"TST": skim_dir}, skim_info["path"])
+		self.assertEqual(4, skim_info["file_count"])
+		self.assertEqual(4 * os.path.getsize(TEST_FILE), skim_info["file_size"])
+		self.assertEqual(3 * TEST_EVENTS - 1, skim_info["event_count"], "unreadable files counted as -1")
+		self.assertEqual(
+			[("0.root", TEST_EVENTS), ("1.root", TEST_EVENTS), ("2.root", TEST_EVENTS), ("broken.root", -1)],
+			sorted((file_info["name"], file_info["event_count"]) for file_info in skim_info["files"])
+		)
+
+
+class CountingCounter(event_count.EventCounter):
+	def __init__(self):
+		self.reads = []
+
+	def get_entries(self, file_path, tree_name="Events"):
+		self.reads.append(os.path.basename(file_path))
+		return event_count.get_counter("header").get_entries(file_path, tree_name)
+
+
+class Test_SkimInventory(SkimTestCase):
+	def setUp(self):
+		SkimTestCase.setUp(self)
+		self.counter = event_count._counters["test_counting"] = CountingCounter()
+		self.counter_options = {"backend": "test_counting"}
+		self.inventory = format_skim_info.SkimInventory(os.path.join(self.test_dir, "inventory.sqlite"))
+
+	def tearDown(self):
+		del event_count._counters["test_counting"]
+		SkimTestCase.tearDown(self)
+
+	def skim_events(self):
+		return dict(
+			(os.path.relpath(skim_info["path"]["TST"], self.datapath), skim_info["event_count"])
+			for skim_info in self.inventory.skim_infos(self.datapath, site="TST")
+		)
+
+	def test_update(self):
+		skim_dirs = [self.make_skim("a", file_count=2), self.make_skim("b", file_count=1)]
+		self.assertEqual(skim_dirs, self.inventory.update(skim_dirs, counter_options=self.counter_options))
+		self.assertEqual({"a": 2 * TEST_EVENTS, "b": TEST_EVENTS}, self.skim_events())
+		self.assertEqual(3, len(self.counter.reads))
+		self.inventory.update(skim_dirs, counter_options=self.counter_options)
+		self.assertEqual(3, len(self.counter.reads), "unchanged skims not listed again")
+		shutil.copy(TEST_FILE, os.path.join(skim_dirs[0], "new.root"))
+		self.inventory.update(skim_dirs, counter_options=self.counter_options)
+		self.assertEqual(["new.root"], self.counter.reads[3:], "only new files counted")
+		self.assertEqual({"a": 3 * TEST_EVENTS, "b": TEST_EVENTS}, self.skim_events())
+		with open(os.path.join(skim_dirs[1], "0.root"), "a") as overwritten:
+			overwritten.write("appended")
+		self.inventory.update(skim_dirs, counter_options=self.counter_options, refresh=True)
+		self.assertEqual(["new.root", "0.root"], self.counter.reads[3:], "refresh counts changed files")
+
+	def test_file_details(self):
+		skim_dir = self.make_skim("a", file_count=2)
+		self.inventory.update([skim_dir], counter_options=self.counter_options)
+		skim_info, = self.inventory.skim_infos(self.datapath, file_details=True)
+		self.assertEqual(
+			[("0.root", TEST_EVENTS), ("1.root", TEST_EVENTS)],
+			[(file_info["name"], file_info["event_count"]) for file_info in skim_info["files"]]
+		)
+		self.assertEqual([], list(self.inventory.skim_infos(os.path.join(self.datapath, "b"))), "other datapath")
+
+	def test_remove_missing(self):
+		skim_dirs = [self.make_skim(rel_path) for rel_path in ("gone", "emptied", "unlisted")]
+		self.inventory.update(skim_dirs, counter_options=self.counter_options)
+		shutil.rmtree(skim_dirs[0])
+		for file_name in os.listdir(skim_dirs[1]):
+			os.unlink(os.path.join(skim_dirs[1], file_name))
+		# the last skim was not found, e.g. since listing its parent failed
+		self.inventory.remove_missing(self.datapath, [])
+		self.assertEqual(["unlisted"], sorted(self.skim_events()), "only skims known to be gone removed")
+		self.inventory.update(skim_dirs[2:], counter_options=self.counter_options)
+		self.assertEqual(6, len(self.counter.reads), "kept skim not counted again")
+
+
+class Test_TwikiFormatter(unittest.TestCase):
+	skim_infos = [
+		format_skim_info.make_skim_info("/a", 2, 100, 84, site="EKP"),
+		format_skim_info.make_skim_info("/long/path/of/b", 1, 123456789, 42, site="NAF"),
+	]
+
+	def setUp(self):
+		self._stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+
+	def tearDown(self):
+		sys.stdout = self._stdout
+
+	def output_lines(self):
+		return sys.stdout.getvalue().splitlines()
+
+	def test_compact(self):
+		formatter = format_skim_info.TwikiFormatter(compact=True)
+		formatter.digest(self.skim_infos[0])
+		self.assertEqual(3, len(self.output_lines()), "header and row written immediately")
+		formatter.close()
+		self.assertEqual(3, len(self.output_lines()))
+
+	def test_buffered(self):
+		with format_skim_info.TwikiFormatter() as formatter:
+			for skim_info in self.skim_infos:
+				formatter.digest(skim_info)
+			self.assertEqual([], self.output_lines(), "rows held until closed")
+		formatter.close()
+		lines = self.output_lines()
+		self.assertEqual(5, len(lines), "header and rows written once")
+		self.assertEqual(1, len(set(len(line) for line in lines)), "columns aligned")
+
+	def test_measured(self):
+		formatter = format_skim_info.TwikiFormatter()
+		for skim_info in self.skim_infos:
+			formatter.measure(skim_info)
+		formatter.digest(self.skim_infos[0])
+		self.assertEqual(3, len(self.output_lines()), "measured rows written immediately")
+		formatter.digest(self.skim_infos[1])
+		formatter.close()
+		lines = self.output_lines()
+		self.assertEqual(5, len(lines))
+		self.assertEqual(1, len(set(len(line) for line in lines)), "columns aligned")
+
+	def test_estimate(self):
+		skim_info = dict(self.skim_infos[0], event_count_error=3)
+		formatter = format_skim_info.TwikiFormatter(compact=True)
+		formatter.digest(skim_info)
+		self.assertTrue("| ~84 +- 3 |" in sys.stdout.getvalue(), "estimated events with uncertainty")
+		formatter.close()
+
+	def test_abstract(self):
+		self.assertRaises(format_skim_info.AbstractError, format_skim_info.BaseFormatter().digest, self.skim_infos[0])
+
+
+class Test_scheduling(SkimTestCase):
+	def setUp(self):
+		SkimTestCase.setUp(self)
+		self.pool = multiprocessing.Pool(1)
+
+	def tearDown(self):
+		self.pool.terminate()
+		SkimTestCase.tearDown(self)
+
+	def test_pool(self):
+		skim_dirs = [self.make_skim(rel_path, file_count) for rel_path, file_count in (("a", 3), ("b", 1), ("c", 0))]
+		os.makedirs(os.path.join(skim_dirs[2], "empty.root"))
+		serial = format_skim_info.collect_skims_info(skim_dirs, counter_options=self.counter_options)
+		pooled = format_skim_info.collect_skims_info(skim_dirs, counter_options=self.counter_options, pool=self.pool)
+		self.assertEqual(
+			sorted(serial, key=lambda skim_info: skim_info["path"]),
+			sorted(pooled, key=lambda skim_info: skim_info["path"]),
+			"same information with a pool"
+		)
+
+	def test_size_order(self):
+		# files of increasing size, e.g. of skims found later
+		tasks = [(size, ((size, None), TEST_FILE, self.counter_options)) for size in range(20)]
+		sizes = [size for (size, _), _ in format_skim_info._count_tasks(tasks, self.pool)]
+		self.assertEqual(range(20), sorted(sizes), "all files counted")
+		# a few tasks are handed to the idle pool before the rest are found
+		self.assertEqual(sorted(sizes[2:], reverse=True), sizes[2:], "largest files counted first")
+
+	def test_lookahead(self):
+		tasks = [(size, ((size, None), TEST_FILE, self.counter_options)) for size in range(20)]
+		sizes = [size for (size, _), _ in format_skim_info._count_tasks(tasks, self.pool, lookahead=4)]
+		self.assertEqual(range(20), sorted(sizes), "all files counted")
+		self.assertTrue(sizes.index(19) >= 15, "at most lookahead tasks held back")
+
+
+class Test_machine_formatters(unittest.TestCase):
+	skim_info = format_skim_info.make_skim_info(
+		"/a", 2, 300, 84, site="EKP",
+		files=[format_skim_info.make_file_info("/a/0.root", 100, 1.5, 42), format_skim_info.make_file_info("/a/1.root", 200, 2.5, 42)]
+	)
+
+	def setUp(self):
+		self._stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+
+	def tearDown(self):
+		sys.stdout = self._stdout
+
+	def test_factory(self):
+		self.assertTrue(isinstance(format_skim_info.formatter_factory("json"), format_skim_info.JSONFormatter))
+		self.assertTrue(format_skim_info.formatter_factory("CSVFormatter(files=True)").file_details, "formatter arguments")
+		self.assertRaises(ValueError, format_skim_info.formatter_factory, "xml")
+
+	def test_json(self):
+		formatter = format_skim_info.formatter_factory("json")
+		formatter.digest(self.skim_info)
+		formatter.digest(self.skim_info)
+		records = [json.loads(line) for line in sys.stdout.getvalue().splitlines()]
+		self.assertEqual([self.skim_info] * 2, records, "one line per skim")
+
+	def test_csv(self):
+		formatter = format_skim_info.formatter_factory("csv")
+		formatter.digest(dict(self.skim_info, event_count_error=3))
+		self.assertEqual(
+			[list(format_skim_info.CSVFormatter._skim_columns), ["/a", "2", "300", "84", "3"]],
+			list(csv.reader(StringIO.StringIO(sys.stdout.getvalue())))
+		)
+
+	def test_csv_files(self):
+		formatter = format_skim_info.formatter_factory("csv(files=True)")
+		formatter.digest(self.skim_info)
+		self.assertEqual(
+			[list(format_skim_info.CSVFormatter._file_columns), ["/a", "0.root", "100", "1.5", "42"], ["/a", "1.root", "200", "2.5", "42"]],
+			list(csv.reader(StringIO.StringIO(sys.stdout.getvalue())))
+		)
+
+
+class Test_estimate(SkimTestCase):
+	def test_sample(self):
+		skim_files = range(100)
+		sample = format_skim_info.sample_skim_files("/a", skim_files, 0.1, min_files=2, seed=1)
+		self.assertEqual(10, len(sample))
+		self.assertEqual(sample, format_skim_info.sample_skim_files("/a", skim_files, 0.1, min_files=2, seed=1), "reproducible")
+		self.assertNotEqual(sample, format_skim_info.sample_skim_files("/b", skim_files, 0.1, min_files=2, seed=1), "per skim")
+		self.assertEqual(20, len(format_skim_info.sample_skim_files("/a", skim_files, 0.1, min_files=20)), "minimum files")
+		self.assertEqual(range(5), list(format_skim_info.sample_skim_files("/a", range(5), 0.1)), "all of few files")
+
+	def test_estimate_events(self):
+		self.assertEqual((80.0, 0.0), format_skim_info.estimate_events([(100, 10), (200, 20)], 4, 800), "constant ratio")
+		self.assertEqual((30.0, 0.0), format_skim_info.estimate_events([(100, 10), (200, 20)], 2, 300), "all files sampled")
+		events, error = format_skim_info.estimate_events([(100, 10), (200, 30)], 4, 600)
+		self.assertAlmostEqual(80.0, events)
+		self.assertAlmostEqual(4 * (0.5 * 200 / 9.0 / 2) ** 0.5, error)
+		self.assertEqual((0.0, 0.0), format_skim_info.estimate_events([], 4, 600), "nothing sampled")
+
+	def test_collect(self):
+		skim_dir = self.make_skim("a", file_count=10)
+		skim_info, = format_skim_info.collect_skims_info(
+			[skim_dir], counter_options=self.counter_options, estimate=0.2, min_files=2
+		)
+		self.assertEqual(2, skim_info["sampled_files"])
+		self.assertEqual(10 * TEST_EVENTS, skim_info["event_count"], "extrapolated events")
+		self.assertEqual(0, skim_info["event_count_error"])
+		self.assertEqual(10, skim_info["file_count"])
+
+
+class Test_snapshots(SkimTestCase):
+	def write_snapshot(self, site, skims, estimate=None):
+		datapath = os.path.join(self.datapath, site.lower())
+		skim_dirs = [self.make_skim(os.path.join(site.lower(), rel_path), file_count) for rel_path, file_count in skims]
+		snapshot_path = os.path.join(self.test_dir, "%s.snapshot" % site)
+		snapshot = format_skim_info.SnapshotWriter(snapshot_path, site, [datapath])
+		for skim_info in format_skim_info.collect_skims_info(
+				skim_dirs, counter_options=self.counter_options, file_details=True, estimate=estimate, min_files=2, site=site):
+			snapshot.write(skim_info)
+		self.assertFalse(os.path.exists(snapshot_path), "snapshot only complete when closed")
+		snapshot.close()
+		return snapshot_path
+
+	def test_merge(self):
+		snapshots = [
+			self.write_snapshot("EKP", [("a", 2), ("b", 1)]),
+			self.write_snapshot("NAF", [("a", 2), ("b", 2)]),
+		]
+		# differing skims are reported as a warning
+		logging.disable(logging.WARNING)
+		try:
+			skim_infos = list(format_skim_info.merge_snapshots(snapshots))
+		finally:
+			logging.disable(logging.NOTSET)
+		self.assertEqual(
+			[
+				{"EKP": os.path.join(self.datapath, "ekp", "a"), "NAF": os.path.join(self.datapath, "naf", "a")},
+				{"EKP": os.path.join(self.datapath, "ekp", "b")},
+				{"NAF": os.path.join(self.datapath, "naf", "b")},
+			],
+			[skim_info["path"] for skim_info in skim_infos],
+			"skims matched by relative path and files"
+		)
+		self.assertEqual([2 * TEST_EVENTS, TEST_EVENTS, 2 * TEST_EVENTS], [skim_info["event_count"] for skim_info in skim_infos])
+		self.assertFalse(any("files" in skim_info for skim_info in skim_infos), "no file details")
+		skim_info = next(format_skim_info.merge_snapshots(snapshots, file_details=True))
+		self.assertEqual(["0.root", "1.root"], sorted(file_info["name"] for file_info in skim_info["files"]))
+
+	def test_prefer_exact(self):
+		snapshots = [
+			self.write_snapshot("EKP", [("a", 4)], estimate=0.1),
+			self.write_snapshot("NAF", [("a", 4)]),
+		]
+		skim_info, = format_skim_info.merge_snapshots(snapshots)
+		self.assertFalse("event_count_error" in skim_info, "exact count preferred over estimate")
+		self.assertEqual(["EKP", "NAF"], sorted(skim_info["path"]))
@@ -0,0 +1,406 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import StringIO
+
+import gc_clone_output
+
+# stand-in for rsync, logging its arguments and the files it should copy
+STUB_COPY = """
+import json
+import os
+import sys
+
+log_path, exit_path = sys.argv[1:3]
+args = sys.argv[3:]
+files = []
+for arg in args:
+	if arg.startswith("--files-from="):
+		with open(arg.partition("=")[2]) as files_from:
+			files = files_from.read().splitlines()
+with open(log_path, "a") as log:
+	log.write(json.dumps({"args": args, "files": files}) + "\\n")
+exit_codes = []
+if os.path.exists(exit_path):
+	with open(exit_path) as exit_file:
+		exit_codes = exit_file.read().split()
+	with open(exit_path, "w") as exit_file:
+		exit_file.write(" ".join(exit_codes[1:]))
+sys.exit(int(exit_codes[0]) if exit_codes else 0)
+"""
+
+
+class CloneTestCase(unittest.TestCase):
+	"""Workdir with the output of jobs 0 to 3 and a stub copy command"""
+	def setUp(self):
+		self.test_dir = tempfile.mkdtemp()
+		self.workdir = os.path.join(self.test_dir, "work")
+		self.source_base = os.path.join(self.test_dir, "source")
+		self.dest_storage = os.path.join(self.test_dir, "dest")
+		for job_id in range(4):
+			os.makedirs(os.path.join(self.workdir, "output", "job_%d" % job_id))
+			os.makedirs(os.path.join(self.source_base, "job_%d" % job_id))
+			with open(os.path.join(self.source_base, self.file_name(job_id)), "w") as source_file:
+				source_file.write("output of job %d\n" % job_id * (job_id + 1))
+		self.stub_path = os.path.join(self.test_dir, "stub_copy.py")
+		with open(self.stub_path, "w") as stub_file:
+			stub_file.write(STUB_COPY)
+		self.copy_log = os.path.join(self.test_dir, "copy.log")
+		self.copy_exit = os.path.join(self.test_dir, "copy.exit")
+		self._stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+
+	def tearDown(self):
+		sys.stdout = self._stdout
+		shutil.rmtree(self.test_dir)
+
+	@staticmethod
+	def file_name(job_id):
+		return os.path.join("job_%d" % job_id, "out.root")
+
+	def job_files(self, job_ids, dest_storage=None):
+		return [(job_id, self.source_base, self.file_name(job_id), dest_storage or self.dest_storage) for job_id in job_ids]
+
+	def make_args(self, cli_args=(), copy_via=None):
+		copy_via = copy_via or [sys.executable, self.stub_path, self.copy_log, self.copy_exit]
+		return gc_clone_output.CLI.parse_args(
+			["--workdir", self.workdir, "--retry-backoff", "0"] + list(cli_args) + ["--copy-via"] + copy_via
+		)
+
+	def set_exit_codes(self, *exit_codes):
+		with open(self.copy_exit, "w") as exit_file:
+			exit_file.write(" ".join(str(exit_code) for exit_code in exit_codes))
+
+	def copy_calls(self):
+		if not os.path.exists(self.copy_log):
+			return []
+		with open(self.copy_log) as copy_log:
+			return [json.loads(line) for line in copy_log]
+
+
+class Test_parse_job_ids(unittest.TestCase):
+	def test_ranges(self):
+		self.assertEqual([0, 1, 2, 5, 7, 8], gc_clone_output.parse_job_ids("5,0-2,7-8,1", None))
+
+	def test_all(self):
+		workdir = tempfile.mkdtemp()
+		try:
+			for job_id in (0, 3, 12):
+				os.makedirs(os.path.join(workdir, "output", "job_%d" % job_id))
+			self.assertEqual([0, 3, 12], gc_clone_output.parse_job_ids("all", workdir))
+		finally:
+			shutil.rmtree(workdir)
+
+
+class Test_clone_batch(CloneTestCase):
+	def test_single_command(self):
+		self.assertEqual(0, gc_clone_output.clone_batch(self.make_args(), self.job_files(range(4))))
+		calls = self.copy_calls()
+		self.assertEqual(1, len(calls), "one copy command for all jobs")
+		self.assertEqual([self.file_name(job_id) for job_id in range(4)], calls[0]["files"])
+		self.assertEqual([self.source_base + "/", self.dest_storage], calls[0]["args"][-2:], "source base and destination")
+
+	def test_batch_size(self):
+		gc_clone_output.clone_batch(self.make_args(["--batch-size", "3"]), self.job_files(range(4)))
+		self.assertEqual([3, 1], [len(call["files"]) for call in self.copy_calls()], "batches of at most 3 jobs")
+
+	def test_destinations(self):
+		other_dest = os.path.join(self.test_dir, "other")
+		gc_clone_output.clone_batch(self.make_args(), self.job_files(range(2)) + self.job_files(range(2), other_dest))
+		self.assertEqual(
+			sorted([self.dest_storage, other_dest]),
+			sorted(call["args"][-1] for call in self.copy_calls()),
+			"one copy command per destination"
+		)
+
+
+class Test_spool(CloneTestCase):
+	def setUp(self):
+		CloneTestCase.setUp(self)
+		self.spool_path = os.path.join(self.workdir, gc_clone_output.SPOOL_NAME)
+
+	def test_read(self):
+		gc_clone_output.spool_jobs(self.spool_path, self.job_files(range(2)))
+		gc_clone_output.spool_jobs(self.spool_path, self.job_files(range(2, 3)))
+		with open(self.spool_path) as spool:
+			self.assertEqual(self.job_files(range(3)), gc_clone_output.read_spool(spool.read()))
+
+	def test_drain(self):
+		args = self.make_args()
+		gc_clone_output.spool_jobs(self.spool_path, self.job_files(range(2)))
+		self.assertEqual(0, gc_clone_output.drain_spool(self.spool_path, args))
+		gc_clone_output.drain_spool(self.spool_path, args)
+		self.assertEqual(1, len(self.copy_calls()), "drained jobs are not transferred again")
+		gc_clone_output.spool_jobs(self.spool_path, self.job_files(range(2, 4)))
+		gc_clone_output.drain_spool(self.spool_path, args)
+		self.assertEqual(
+			[[self.file_name(0), self.file_name(1)], [self.file_name(2), self.file_name(3)]],
+			[call["files"] for call in self.copy_calls()],
+			"only jobs spooled after the last drain"
+		)
+
+	def test_partial_line(self):
+		args = self.make_args()
+		gc_clone_output.spool_jobs(self.spool_path, self.job_files([0]))
+		partial_line = "%d\t%s\t%s\t%s\n" % self.job_files([1])[0]
+		with open(self.spool_path, "a") as spool:
+			spool.write(partial_line[:10])
+		gc_clone_output.drain_spool(self.spool_path, args)
+		with open(self.spool_path, "a") as spool:
+			spool.write(partial_line[10:])
+		gc_clone_output.drain_spool(self.spool_path, args)
+		self.assertEqual(
+			[[self.file_name(0)], [self.file_name(1)]],
+			[call["files"] for call in self.copy_calls()],
+			"line completed after a drain is transferred by the next"
+		)
+
+
+class Test_dest_host(unittest.TestCase):
+	def test_hosts(self):
+		self.assertEqual("", gc_clone_output.dest_host("/local/path"), "local path")
+		self.assertEqual("", gc_clone_output.dest_host("relative/with:colon"), "local path with colon")
+		self.assertEqual("host", gc_clone_output.dest_host("host:/path"))
+		self.assertEqual("host", gc_clone_output.dest_host("user@host:/path"))
+		self.assertEqual("host", gc_clone_output.dest_host("rsync://user@host:873/module"))
+
+
+class Test_run_transfers(unittest.TestCase):
+	def setUp(self):
+		self.lock = threading.Lock()
+		self.running = {}
+		self.max_running = {}
+
+	def transfer(self, host, exit_code=0):
+		def run_transfer():
+			with self.lock:
+				self.running[host] = self.running.get(host, 0) + 1
+				self.max_running[host] = max(self.max_running.get(host, 0), self.running[host])
+			time.sleep(0.05)
+			with self.lock:
+				self.running[host] -= 1
+			return exit_code
+		return host, run_transfer
+
+	def test_host_workers(self):
+		transfers = [self.transfer("a") for _ in range(6)] + [self.transfer("b") for _ in range(6)]
+		self.assertEqual(0, gc_clone_output.run_transfers(transfers, workers=8, host_workers=2))
+		self.assertEqual({"a": 2, "b": 2}, self.max_running, "transfers per remote host limited")
+
+	def test_local_workers(self):
+		transfers = [self.transfer("") for _ in range(8)]
+		gc_clone_output.run_transfers(transfers, workers=4, host_workers=1)
+		self.assertEqual({"": 4}, self.max_running, "local transfers only limited by workers")
+
+	def test_exit_code(self):
+		transfers = [self.transfer("a"), self.transfer("b", exit_code=1), self.transfer("")]
+		self.assertEqual(1, gc_clone_output.run_transfers(transfers, workers=2))
+		self.assertEqual(1, gc_clone_output.run_transfers(transfers[1:2]), "single transfer")
+		self.assertEqual(0, gc_clone_output.run_transfers([]), "no transfers")
+
+
+class Test_TransferLedger(CloneTestCase):
+	def setUp(self):
+		CloneTestCase.setUp(self)
+		self.ledger_path = os.path.join(self.workdir, gc_clone_output.LEDGER_NAME)
+		self.source_path = os.path.join(self.source_base, self.file_name(1))
+		self.adler32_calls = []
+		self._file_adler32 = gc_clone_output.file_adler32
+		gc_clone_output.file_adler32 = self.file_adler32
+
+	def tearDown(self):
+		gc_clone_output.file_adler32 = self._file_adler32
+		CloneTestCase.tearDown(self)
+
+	def file_adler32(self, file_path):
+		self.adler32_calls.append(file_path)
+		return self._file_adler32(file_path)
+
+	def test_skip(self):
+		args = self.make_args()
+		ledger = gc_clone_output.TransferLedger(self.ledger_path)
+		gc_clone_output.clone_batch(args, self.job_files(range(4)), ledger=ledger)
+		gc_clone_output.clone_batch(args, self.job_files(range(4)), ledger=ledger)
+		self.assertEqual(1, len(self.copy_calls()), "transferred files skipped")
+		with open(self.source_path, "a") as source_file:
+			source_file.write("more output\n")
+		gc_clone_output.clone_batch(args, self.job_files(range(4)), ledger=gc_clone_output.TransferLedger(self.ledger_path))
+		self.assertEqual([self.file_name(1)], self.copy_calls()[-1]["files"], "changed file transferred again")
+
+	def test_failed(self):
+		self.set_exit_codes(23)
+		ledger = gc_clone_output.TransferLedger(self.ledger_path)
+		gc_clone_output.clone_batch(self.make_args(), self.job_files([1]), ledger=ledger)
+		self.assertFalse(ledger.is_transferred(1, self.source_path, self.dest_storage), "failed transfer not recorded")
+
+	def test_checksum(self):
+		os.utime(self.source_path, (1000000000, 1000000000))
+		gc_clone_output.TransferLedger(self.ledger_path).record(1, self.source_path, self.dest_storage)
+		checksum_ledger = gc_clone_output.TransferLedger(self.ledger_path, checksum=True)
+		self.assertTrue(checksum_ledger.is_transferred(1, self.source_path, self.dest_storage), "record without checksum")
+		checksum_ledger.record(1, self.source_path, self.dest_storage)
+		self.assertFalse(checksum_ledger.is_transferred(0, self.source_path, self.dest_storage), "other job")
+		# change the content, but neither size nor modification time
+		with open(self.source_path, "r+") as source_file:
+			source_file.write("X")
+		os.utime(self.source_path, (1000000000, 1000000000))
+		self.assertFalse(
+			gc_clone_output.TransferLedger(self.ledger_path, checksum=True).is_transferred(1, self.source_path, self.dest_storage),
+			"checksum changed"
+		)
+		self.assertTrue(
+			gc_clone_output.TransferLedger(self.ledger_path).is_transferred(1, self.source_path, self.dest_storage),
+			"checksum ignored"
+		)
+
+	def test_checksum_once(self):
+		gc_clone_output.TransferLedger(self.ledger_path, checksum=True).record(0, self.source_path, self.dest_storage)
+		ledger = gc_clone_output.TransferLedger(self.ledger_path, checksum=True)
+		self.assertFalse(ledger.is_transferred(1, self.source_path, self.dest_storage))
+		ledger.record(1, self.source_path, self.dest_storage)
+		self.assertEqual(2, len(self.adler32_calls), "checksum computed once per transfer")
+
+	def test_dcache_checksum(self):
+		with open(os.path.join(os.path.dirname(self.source_path), ".(get)(out.root)(checksums)"), "w") as checksums:
+			checksums.write("ADLER32:0000abcd\n")
+		self.assertEqual(0xabcd, gc_clone_output.dcache_adler32(self.source_path))
+		ledger = gc_clone_output.TransferLedger(self.ledger_path, checksum=True)
+		ledger.record(1, self.source_path, self.dest_storage)
+		self.assertTrue(ledger.is_transferred(1, self.source_path, self.dest_storage))
+		self.assertEqual([], self.adler32_calls, "checksum of dCache used")
+		self.assertEqual(None, gc_clone_output.dcache_adler32(os.path.join(self.source_base, self.file_name(2))), "no checksum")
+
+
+class Test_retries(CloneTestCase):
+	def setUp(self):
+		CloneTestCase.setUp(self)
+		self.command = [sys.executable, self.stub_path, self.copy_log, self.copy_exit]
+		self.failed_path = os.path.join(self.workdir, gc_clone_output.FAILED_NAME)
+
+	def test_transient(self):
+		self.set_exit_codes(12, 30)
+		attempts = []
+		gc_clone_output.check_output_retry(self.command, retries=2, backoff=0, attempts=attempts)
+		self.assertEqual([12, 30], attempts, "transient errors retried")
+		self.assertEqual(3, len(self.copy_calls()))
+
+	def test_exhausted(self):
+		self.set_exit_codes(12, 12, 12, 12)
+		self.assertRaises(subprocess.CalledProcessError, gc_clone_output.check_output_retry, self.command, retries=2, backoff=0)
+		self.assertEqual(3, len(self.copy_calls()), "at most 2 retries")
+
+	def test_permanent(self):
+		for exit_code in (1, 22, 23):
+			self.set_exit_codes(exit_code, 0)
+			self.assertRaises(subprocess.CalledProcessError, gc_clone_output.check_output_retry, self.command, retries=2, backoff=0)
+		self.assertEqual(3, len(self.copy_calls()), "permanent errors not retried")
+
+	def test_retry_failed(self):
+		args = self.make_args()
+		self.set_exit_codes(23)
+		self.assertEqual(1, gc_clone_output.clone_batch(args, self.job_files(range(2))))
+		self.assertTrue(os.path.exists(self.failed_path), "failed transfers recorded")
+		self.set_exit_codes(23)
+		self.assertEqual(1, gc_clone_output.retry_failed(self.failed_path, args))
+		self.assertEqual(self.copy_calls()[0]["files"], self.copy_calls()[1]["files"], "failed transfers repeated")
+		self.assertTrue(os.path.exists(self.failed_path), "transfers failing again recorded anew")
+		self.assertEqual(0, gc_clone_output.retry_failed(self.failed_path, args))
+		self.assertFalse(os.path.exists(self.failed_path))
+		self.assertEqual(0, gc_clone_output.retry_failed(self.failed_path, args), "nothing to retry")
+		self.assertEqual(3, len(self.copy_calls()))
+
+
+class Test_native_copy(CloneTestCase):
+	def dest_files(self):
+		return sorted(
+			os.path.relpath(os.path.join(dir_path, file_name), self.dest_storage)
+			for dir_path, _, file_names in os.walk(self.dest_storage) for file_name in file_names
+		)
+
+	def test_copy(self):
+		gc_clone_output.native_copy(self.source_base, [self.file_name(0), "job_[12]/*.root"], self.dest_storage)
+		self.assertEqual([self.file_name(job_id) for job_id in range(3)], self.dest_files())
+		for job_id in range(3):
+			source_path = os.path.join(self.source_base, self.file_name(job_id))
+			dest_path = os.path.join(self.dest_storage, self.file_name(job_id))
+			with open(source_path) as source_file, open(dest_path) as dest_file:
+				self.assertEqual(source_file.read(), dest_file.read(), "content copied")
+			self.assertAlmostEqual(os.stat(source_path).st_mtime, os.stat(dest_path).st_mtime, delta=1E-3, msg="timestamp preserved")
+
+	def test_missing(self):
+		self.assertRaises(IOError, gc_clone_output.native_copy, self.source_base, ["job_9/out.root"], self.dest_storage)
+
+	def test_short_copy(self):
+		def short_copyfileobj(source_file, dest_file, length=None):
+			dest_file.write(source_file.read()[:-1])
+		copyfileobj, shutil.copyfileobj = shutil.copyfileobj, short_copyfileobj
+		try:
+			self.assertRaises(IOError, gc_clone_output.native_copy, self.source_base, [self.file_name(1)], self.dest_storage)
+		finally:
+			shutil.copyfileobj = copyfileobj
+		self.assertEqual([], self.dest_files(), "neither incomplete nor temporary file kept")
+
+	def test_clone_batch(self):
+		args = self.make_args(["--workers", "2"], copy_via=["native"])
+		self.assertEqual(0, gc_clone_output.clone_batch(args, self.job_files(range(4))))
+		self.assertEqual([self.file_name(job_id) for job_id in range(4)], self.dest_files())
+		os.unlink(os.path.join(self.source_base, self.file_name(3)))
+		self.assertEqual(1, gc_clone_output.clone_batch(args, self.job_files(range(4))), "missing source fails")
+
+
+class Test_TransferStats(CloneTestCase):
+	def setUp(self):
+		CloneTestCase.setUp(self)
+		self.stats_path = os.path.join(self.workdir, gc_clone_output.STATS_NAME)
+
+	def records(self):
+		with open(self.stats_path) as stats_file:
+			return [json.loads(line) for line in stats_file]
+
+	def test_record(self):
+		stats = gc_clone_output.TransferStats(self.stats_path)
+		stats.meta_times.update({0: 0.25, 1: 0.5})
+		gc_clone_output.clone_batch(self.make_args(), self.job_files(range(4)), stats=stats)
+		self.set_exit_codes(12, 23)
+		gc_clone_output.clone_batch(self.make_args(), self.job_files(range(2)), stats=stats)
+		success, failure = self.records()
+		self.assertEqual([0, 1, 2, 3], success["job_ids"])
+		self.assertEqual(4, success["files"])
+		self.assertEqual(
+			sum(os.path.getsize(os.path.join(self.source_base, self.file_name(job_id))) for job_id in range(4)),
+			success["bytes"]
+		)
+		self.assertEqual(0.75, success["meta_time"], "meta time of jobs")
+		self.assertEqual((0, 0), (success["retries"], success["exit_code"]))
+		self.assertTrue(success["throughput"] > 0)
+		self.assertEqual((1, 1), (failure["retries"], failure["exit_code"]), "retried transfer failing permanently")
+		self.assertEqual(None, failure["throughput"], "no throughput of failed transfers")
+
+	def test_summarize(self):
+		stats = gc_clone_output.TransferStats(self.stats_path)
+		gc_clone_output.clone_batch(self.make_args(), self.job_files(range(4)), stats=stats)
+		self.set_exit_codes(23)
+		gc_clone_output.clone_batch(self.make_args(), self.job_files(range(2)), stats=stats)
+		sys.stdout = StringIO.StringIO()
+		gc_clone_output.summarize_stats(self.stats_path)
+		summary = sys.stdout.getvalue().splitlines()
+		self.assertTrue(summary[0].startswith("transfers: 2 (1 failed), jobs: 6, files: 6"), summary[0])
+		self.assertEqual(
+			["meta time [s]", "copy time [s]", "retries", "throughput [MB/s]"],
+			[line[:18].strip() for line in summary[2:6]]
+		)
+		self.assertTrue(summary[6].startswith("aggregate:"), summary[6])
+
+	def test_summarize_empty(self):
+		open(self.stats_path, "w").close()
+		gc_clone_output.summarize_stats(self.stats_path)
+		self.assertTrue(sys.stdout.getvalue().startswith("no transfers logged"))
+
+	def test_percentiles(self):
+		self.assertEqual([50, 90, 99, 100], gc_clone_output._percentiles(range(100, 0, -1)))
+		self.assertEqual([1, 1, 1, 1], gc_clone_output._percentiles([1]))
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import gc_tools.gc_job
+
+class Test_GCJobMeta(unittest.TestCase):
+	def setUp(self):
+		self.workdir = tempfile.mkdtemp()
+		output_dir = os.path.join(self.workdir, "output", "job_3")
+		os.makedirs(output_dir)
+		with open(os.path.join(output_dir, "job.info"), "w") as job_info:
+			job_info.write("JOBID=3\nEXITCODE=0\nSTATUS=SUCCESS\nRUNTIME=120\n")
+		with open(os.path.join(output_dir, "gc.stdout"), "w") as gc_stdout:
+			gc_stdout.write("Running job 3\nexport SE_OUTPUT_PATH='/pnfs/foo'\nexport MY_JOBID=3\nexport PLAIN=bar\n")
+		self.job_meta = gc_tools.gc_job.GCJobMeta(self.workdir, "3")
+
+	def tearDown(self):
+		shutil.rmtree(self.workdir)
+
+	def test_info(self):
+		self.assertEqual(0, self.job_meta.exitcode, "exit code")
+		self.assertEqual("SUCCESS", self.job_meta.status, "string field")
+		self.assertEqual(120, self.job_meta.runtime, "literal field")
+		self.assertEqual(None, self.job_meta.host, "missing field")
+
+	def test_environ(self):
+		self.assertEqual("/pnfs/foo", self.job_meta.environ["SE_OUTPUT_PATH"], "string variable")
+		self.assertEqual(3, self.job_meta.environ["MY_JOBID"], "literal variable")
+		self.assertEqual("bar", self.job_meta.environ["PLAIN"], "unquoted variable")
+		self.assertEqual("default", self.job_meta.environ.get("UNDEFINED", "default"), "missing variable")
+		self.assertRaises(KeyError, lambda: self.job_meta.environ["UNDEFINED"])
+
+	def test_single_read(self):
+		self.job_meta.environ.get("UNDEFINED")
+		os.unlink(self.job_meta.gc_stdout)
+		self.assertEqual("/pnfs/foo", self.job_meta.environ["SE_OUTPUT_PATH"], "cached variable")
+		self.assertEqual(None, self.job_meta.environ.get("UNDEFINED"), "cached missing variable")
+
+
+class Test_GCTask(unittest.TestCase):
+	def setUp(self):
+		self.workdir = tempfile.mkdtemp()
+		for job_id, exitcode, se_path in ((0, 0, "/pnfs/foo"), (1, 1, "/pnfs/bar"), (2, 0, "/pnfs/foo"), (11, None, None)):
+			output_dir = os.path.join(self.workdir, "output", "job_%d" % job_id)
+			os.makedirs(output_dir)
+			if exitcode is None:
+				continue
+			with open(os.path.join(output_dir, "job.info"), "w") as job_info:
+				job_info.write("EXITCODE=%d\nRUNTIME=%d\n" % (exitcode, 10 * (job_id + 1)))
+			with open(os.path.join(output_dir, "gc.stdout"), "w") as gc_stdout:
+				gc_stdout.write("export SE_OUTPUT_PATH='%s'\n" % se_path)
+		os.makedirs(os.path.join(self.workdir, "output", "job_x"))
+		self.task = gc_tools.gc_job.GCTask(self.workdir, workers=2)
+
+	def tearDown(self):
+		shutil.rmtree(self.workdir)
+
+	def test_discovery(self):
+		self.assertEqual([0, 1, 2, 11], self.task.job_ids, "job directories")
+		self.assertEqual([0, 1, 2, 11], sorted(self.task.jobs), "job meta information")
+
+	def test_queries(self):
+		by_exitcode = self.task.by_exitcode()
+		self.assertEqual([0, 2], [job_meta.job_id for job_meta in by_exitcode[0]], "successful jobs")
+		self.assertEqual([1], [job_meta.job_id for job_meta in by_exitcode[1]], "failed jobs")
+		by_path = self.task.by_environ("SE_OUTPUT_PATH")
+		self.assertEqual([0, 2], [job_meta.job_id for job_meta in by_path["/pnfs/foo"]], "jobs by path")
+		self.assertEqual(60, self.task.total_runtime(), "total runtime")
+
+	def test_cache(self):
+		self.assertEqual([0, 2], [job_meta.job_id for job_meta in gc_tools.gc_job.GCTask(self.workdir, cache=True).by_exitcode()[0]], "uncached jobs")
+		self.assertTrue(os.path.exists(os.path.join(self.workdir, "gc_job_meta.cache")), "cache file")
+		cached_task = gc_tools.gc_job.GCTask(self.workdir, cache=True)
+		self.assertEqual("/pnfs/foo", cached_task.jobs[0].environ["SE_OUTPUT_PATH"], "cached variable")
+		with open(os.path.join(self.workdir, "output", "job_2", "job.info"), "w") as job_info:
+			job_info.write("EXITCODE=1\nRUNTIME=30\n# modified\n")
+		self.assertEqual([0], [job_meta.job_id for job_meta in gc_tools.gc_job.GCTask(self.workdir, cache=True).by_exitcode()[0]], "modified jobs")
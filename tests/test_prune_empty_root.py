@@ -0,0 +1,64 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import StringIO
+
+import prune_empty_root
+
+
+class Test_remove_manifest(unittest.TestCase):
+	def setUp(self):
+		self.test_dir = tempfile.mkdtemp()
+		self.manifest = os.path.join(self.test_dir, "manifest")
+		self.file_paths = []
+		for idx in range(5):
+			file_path = os.path.join(self.test_dir, "data", "%d.root" % idx)
+			if not os.path.isdir(os.path.dirname(file_path)):
+				os.makedirs(os.path.dirname(file_path))
+			open(file_path, "w").close()
+			self.file_paths.append(file_path)
+		self._stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+
+	def tearDown(self):
+		sys.stdout = self._stdout
+		shutil.rmtree(self.test_dir)
+
+	def existing(self):
+		return [file_path for file_path in self.file_paths if os.path.exists(file_path)]
+
+	def test_remove(self):
+		prune_empty_root.write_manifest(self.manifest, self.file_paths[:3])
+		self.assertTrue(prune_empty_root.manifest_pending(self.manifest))
+		prune_empty_root.remove_manifest(self.manifest, batch_size=2)
+		self.assertEqual(self.file_paths[3:], self.existing(), "listed files removed")
+		self.assertFalse(prune_empty_root.manifest_pending(self.manifest))
+		prune_empty_root.write_manifest(self.manifest, self.file_paths[3:4])
+		prune_empty_root.remove_manifest(self.manifest, batch_size=2)
+		self.assertEqual(self.file_paths[4:], self.existing(), "only added files removed")
+
+	def test_resume(self):
+		prune_empty_root.write_manifest(self.manifest, self.file_paths[:4])
+		# killed after removing the first file, before storing the offset
+		os.unlink(self.file_paths[0])
+		with open(self.manifest, "a") as manifest:
+			manifest.write(self.file_paths[4][:5])
+		self.assertTrue(prune_empty_root.manifest_pending(self.manifest))
+		prune_empty_root.remove_manifest(self.manifest, batch_size=2)
+		self.assertEqual(self.file_paths[4:], self.existing(), "remaining files removed, incomplete line ignored")
+		self.assertFalse(prune_empty_root.manifest_pending(self.manifest))
+
+	def test_dry_run(self):
+		prune_empty_root.write_manifest(self.manifest, self.file_paths[:2])
+		prune_empty_root.remove_manifest(self.manifest, dry_run=True)
+		self.assertEqual(self.file_paths, self.existing(), "no files removed")
+		self.assertTrue(prune_empty_root.manifest_pending(self.manifest), "files still pending")
+
+	def test_quarantine(self):
+		quarantine = os.path.join(self.test_dir, "quarantine")
+		prune_empty_root.write_manifest(self.manifest, self.file_paths[:2])
+		prune_empty_root.remove_manifest(self.manifest, quarantine=quarantine)
+		self.assertEqual(self.file_paths[2:], self.existing())
+		for file_path in self.file_paths[:2]:
+			self.assertTrue(os.path.exists(prune_empty_root.quarantine_path(file_path, quarantine)), "file moved")
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from utility import event_count
+
+TEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "events.root")
+
+class Test_get_counter(unittest.TestCase):
+	def test_backends(self):
+		for backend in ("header", "auto"):
+			self.assertEqual(42, event_count.get_counter(backend).get_entries(TEST_FILE, "Events"), backend)
+		self.assertTrue(event_count.get_counter("auto") is event_count.get_counter("auto"), "reused backend")
+
+	def test_unknown(self):
+		self.assertRaises(ValueError, event_count.get_counter, "no such backend")
+
+
+class FixedCounter(event_count.EventCounter):
+	def __init__(self, result):
+		self.result = result
+
+	def get_entries(self, file_path, tree_name="Events"):
+		if isinstance(self.result, Exception):
+			raise self.result
+		return self.result
+
+
+class Test_AutoCounter(unittest.TestCase):
+	backends = {
+		"test_missing": FixedCounter(KeyError("Events")),
+		"test_broken": FixedCounter(ValueError("broken")),
+		"test_unavailable": FixedCounter(event_count.InstallationError("unavailable")),
+		"test_filled": FixedCounter(42),
+	}
+
+	def setUp(self):
+		event_count._counters.update(self.backends)
+
+	def tearDown(self):
+		for name in self.backends:
+			del event_count._counters[name]
+
+	def test_fallback(self):
+		for backends in (
+			("test_missing", "test_filled"), ("test_broken", "test_filled"), ("test_unavailable", "test_filled")
+		):
+			self.assertEqual(42, event_count.AutoCounter(backends).get_entries(TEST_FILE), backends)
+
+	def test_failure(self):
+		self.assertRaises(
+			KeyError, event_count.AutoCounter(("test_unavailable", "test_missing", "test_broken")).get_entries, TEST_FILE
+		)
+		self.assertRaises(
+			event_count.InstallationError, event_count.AutoCounter(("test_unavailable",)).get_entries, TEST_FILE
+		)
+
+
+
+class CountingCounter(event_count.EventCounter):
+	def __init__(self):
+		self.reads = 0
+
+	def get_entries(self, file_path, tree_name="Events"):
+		self.reads += 1
+		return event_count.get_counter("header").get_entries(file_path, tree_name)
+
+
+class Test_CachedCounter(unittest.TestCase):
+	def setUp(self):
+		self.cache_dir = tempfile.mkdtemp()
+		self.cache_path = os.path.join(self.cache_dir, "cache", "event_counts.sqlite")
+
+	def tearDown(self):
+		shutil.rmtree(self.cache_dir)
+
+	def test_cached(self):
+		counter = CountingCounter()
+		cached = event_count.CachedCounter(counter, cache_path=self.cache_path)
+		for _ in range(2):
+			self.assertEqual(42, cached.get_entries(TEST_FILE, "Events"))
+			self.assertRaises(KeyError, cached.get_entries, TEST_FILE, "NoSuchTree")
+		self.assertEqual(2, counter.reads, "cached across lookups")
+		self.assertEqual(42, event_count.CachedCounter(counter, cache_path=self.cache_path).get_entries(TEST_FILE))
+		self.assertEqual(2, counter.reads, "cached across instances")
+		self.assertEqual(42, event_count.CachedCounter(counter, cache_path=self.cache_path, refresh=True).get_entries(TEST_FILE))
+		self.assertEqual(3, counter.reads, "refreshed")
+
+	def test_evict(self):
+		counter = CountingCounter()
+		cached = event_count.CachedCounter(counter, cache_path=self.cache_path, max_files=1)
+		cached.evict_interval = 1
+		cached.get_entries(TEST_FILE, "Events")
+		cached.get_entries(TEST_FILE, "Empty")
+		cached.get_entries(TEST_FILE, "Empty")
+		self.assertEqual(2, counter.reads)
+		cached.get_entries(TEST_FILE, "Events")
+		self.assertEqual(3, counter.reads, "least recently used count evicted")
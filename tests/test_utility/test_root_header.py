@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from utility import root_header, event_count
+from utility.exceptions import InstallationError
+
+TEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "events.root")
+
+class Test_RootFile(unittest.TestCase):
+	def test_keys(self):
+		with root_header.RootFile(TEST_FILE) as root_file:
+			self.assertEqual(["Events", "Empty"], [key.name for key in root_file.keys], "key names")
+			self.assertEqual(["TTree", "TTree"], [key.class_name for key in root_file.keys], "key classes")
+
+	def test_entries(self):
+		with root_header.RootFile(TEST_FILE) as root_file:
+			self.assertEqual(42, root_file.get_entries("Events"), "filled tree")
+			self.assertEqual(0, root_file.get_entries("Empty"), "empty tree")
+			self.assertRaises(KeyError, root_file.get_entries, "Missing")
+
+	def test_not_root(self):
+		with tempfile.NamedTemporaryFile() as not_root:
+			not_root.write(b"not a ROOT file" * 10)
+			not_root.flush()
+			self.assertRaises(ValueError, root_header.RootFile, not_root.name)
+
+	def test_truncated(self):
+		with open(TEST_FILE, "rb") as source:
+			data = source.read()
+		for size in (4, 40, 200, len(data) // 2):
+			with tempfile.NamedTemporaryFile() as truncated:
+				truncated.write(data[:size])
+				truncated.flush()
+				try:
+					with root_header.RootFile(truncated.name) as root_file:
+						root_file.get_entries("Events")
+				except (ValueError, KeyError):
+					pass
+
+	def test_subdirectory(self):
+		with root_header.RootFile(TEST_FILE) as root_file:
+			self.assertRaises(InstallationError, root_file.get_entries, "sub/Events")
+
+class Test_has_entries(unittest.TestCase):
+	def test_has_entries(self):
+		counter = event_count.get_counter("header")
+		self.assertTrue(counter.get_entries(TEST_FILE, "Events") > 0, "filled tree")
+		self.assertFalse(counter.get_entries(TEST_FILE, "Empty") > 0, "empty tree")
+		self.assertRaises(KeyError, counter.get_entries, TEST_FILE, "Missing")
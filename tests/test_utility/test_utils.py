@@ -0,0 +1,28 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+from utility.utils import iter_globs
+
+class Test_iter_globs(unittest.TestCase):
+	def setUp(self):
+		self.basedir = tempfile.mkdtemp()
+		for file_path in ("a/1.root", "a/2.root", "a/.hidden.root", "a/info.txt", "b/3.root"):
+			file_path = os.path.join(self.basedir, file_path)
+			if not os.path.isdir(os.path.dirname(file_path)):
+				os.makedirs(os.path.dirname(file_path))
+			open(file_path, "w").close()
+
+	def tearDown(self):
+		shutil.rmtree(self.basedir)
+
+	def test_glob_equivalent(self):
+		for pattern in ("*/*.root", "a/*", "a/.hidden.root", "a/info.txt", "c/*", "*/"):
+			pattern = os.path.join(self.basedir, pattern)
+			self.assertEqual(sorted(glob.glob(pattern)), sorted(iter_globs(pattern)), pattern)
+
+	def test_multiple(self):
+		patterns = [os.path.join(self.basedir, pattern) for pattern in ("a/*.root", "a/*.txt")]
+		self.assertEqual(sorted(glob.glob(patterns[0]) + glob.glob(patterns[1])), sorted(iter_globs(*patterns)), "all patterns")
@@ -0,0 +1,57 @@
+import unittest
+
+import websync_lineup
+
+
+class Test_compile_comparison(unittest.TestCase):
+	def test_uneven(self):
+		collections = [
+			[("one", "f"), ("one", "a"), ("one", "e"), ("one", "c")],
+			[("two", "c"), ("two", "b")],
+			[("three", "g")],
+			[],
+		]
+		self.assertEqual(
+			[
+				[("one", "a"), None, None, None],
+				[None, ("two", "b"), None, None],
+				[("one", "c"), ("two", "c"), None, None],
+				[("one", "e"), None, None, None],
+				[("one", "f"), None, None, None],
+				[None, None, ("three", "g"), None],
+			],
+			list(websync_lineup.compile_comparison(collections)),
+			"trailing items kept"
+		)
+
+	def test_duplicates(self):
+		collections = [
+			[("one", "a"), ("one/sub", "a"), ("one", "b")],
+			[("two", "a"), ("two", "b"), ("two/sub", "b")],
+		]
+		rows = list(websync_lineup.compile_comparison(collections))
+		self.assertEqual(
+			[["a", "a"], ["a", None], ["b", "b"], [None, "b"]],
+			[[item and item[1] for item in row] for row in rows],
+			"n'th occurrences of a basename share a row"
+		)
+		self.assertEqual(
+			sorted(item for collection in collections for item in collection),
+			sorted(item for row in rows for item in row if item is not None),
+			"every item in a row"
+		)
+
+	def test_min_count(self):
+		collections = [
+			[("one", "a"), ("one", "b"), ("one", "c")],
+			[("two", "b"), ("two", "c")],
+			[("three", "c"), ("three", "d")],
+		]
+		self.assertEqual(
+			[["b", "b", None], ["c", "c", "c"]],
+			[[item and item[1] for item in row] for row in websync_lineup.compile_comparison(collections, min_count=2)]
+		)
+		self.assertEqual(
+			[["c", "c", "c"]],
+			[[item and item[1] for item in row] for row in websync_lineup.compile_comparison(collections, min_count=3)]
+		)
@@ -0,0 +1,302 @@
+"""
+Count the events in ROOT files using interchangeable backends
+
+Backends are selected at runtime by name via :py:func:`get_counter`. Third
+party modules, notably :py:mod:`ROOT`, are only imported once a backend using
+them is requested. This keeps applications fast to start if they do not
+actually count events, or can do so without such modules.
+
+The following backends are available:
+
+**root**
+  Opens files with :py:mod:`ROOT`. This supports any file, but importing
+  :py:mod:`ROOT` takes several seconds.
+
+**uproot**
+  Opens files with :py:mod:`uproot`.
+
+**header**
+  Reads only the headers of files via :py:mod:`utility.root_header`, without
+  third party modules.
+
+**auto**
+  Uses the **header** backend, falling back to **uproot** and **root** for
+  files it cannot read or trees it cannot find.
+
+Any backend may be combined with a persistent cache of event counts, see
+:py:class:`~.CachedCounter`. Files are only read again if their size or
+modification time changes.
+"""
+# standard library imports
+import os
+import sqlite3
+import time
+
+# third party imports
+
+# application/library imports
+from .exceptions import AbstractError, InstallationError
+from . import root_header
+
+
+class EventCounter(object):
+    """Interface of backends counting events"""
+    #: name to select the backend
+    name = None
+
+    def get_entries(self, file_path, tree_name="Events"):
+        """
+        Get the number of entries of a TTree in a ROOT file
+
+        :param file_path: path to the ROOT file
+        :type file_path: str
+        :param tree_name: name of the TTree
+        :type tree_name: str
+        :return: number of entries
+        :rtype: int
+        :raises KeyError: if the file contains no object ``tree_name``
+        :raises ValueError: if the file cannot be read
+        :raises InstallationError: if the backend cannot read files on this host
+        """
+        raise AbstractError
+
+    def __repr__(self):
+        return "%s()" % self.__class__.__name__
+
+
+class PyROOTCounter(EventCounter):
+    name = "root"
+
+    def __init__(self):
+        try:
+            import ROOT
+        except ImportError:
+            raise InstallationError("Module ROOT is not available")
+        # suppress ROOT output
+        ROOT.PyConfig.IgnoreCommandLineOptions = True
+        ROOT.gErrorIgnoreLevel = ROOT.kError
+        self._root = ROOT
+
+    def get_entries(self, file_path, tree_name="Events"):
+        data = self._root.TFile(file_path)
+        if data.IsZombie():
+            raise ValueError("Cannot open ROOT file '%s'" % file_path)
+        try:
+            tree = data.Get(tree_name)
+            if not tree:
+                raise KeyError(tree_name)
+            return tree.GetEntries()
+        except AttributeError:
+            # some data structure is missing
+            raise KeyError(tree_name)
+        finally:
+            data.Close()
+
+
+class UprootCounter(EventCounter):
+    name = "uproot"
+
+    def __init__(self):
+        try:
+            import uproot
+        except ImportError:
+            raise InstallationError("Module uproot is not available")
+        self._uproot = uproot
+
+    def get_entries(self, file_path, tree_name="Events"):
+        tree = self._uproot.open(file_path)[tree_name]
+        try:
+            return tree.num_entries
+        except AttributeError:
+            # uproot 3
+            return tree.numentries
+
+
+class HeaderCounter(EventCounter):
+    name = "header"
+
+    def get_entries(self, file_path, tree_name="Events"):
+        with root_header.RootFile(file_path) as root_file:
+            return root_file.get_entries(tree_name)
+
+
+class AutoCounter(EventCounter):
+    """
+    Counts events with the first backend able to read a file
+
+    A backend failing to find a tree or to read a file may just not support
+    it, so any remaining backends are tried as well. If no backend succeeds,
+    the error of the first backend actually reading the file is raised.
+
+    :param backends: names of the backends to try in order
+    :type backends: list[str]
+    """
+    name = "auto"
+
+    def __init__(self, backends=("header", "uproot", "root")):
+        self.backends = backends
+
+    def get_entries(self, file_path, tree_name="Events"):
+        file_error, install_error = None, None
+        for backend in self.backends:
+            try:
+                return get_counter(backend).get_entries(file_path, tree_name)
+            except InstallationError as err:
+                install_error = install_error or err
+            except (KeyError, ValueError) as err:
+                file_error = file_error or err
+        raise file_error or install_error
+
+
+class CachedCounter(EventCounter):
+    """
+    Persistent cache for the event counts of another backend
+
+    Counts are stored by file path and tree name, and reused as long as the
+    size and modification time of the file are unchanged. If the cache holds
+    more than ``max_files`` counts, the least recently used ones are removed.
+
+    :param counter: backend for counting events not in the cache
+    :type counter: :py:class:`~.EventCounter`
+    :param cache_path: path of the SQLite database storing the cache
+    :type cache_path: str
+    :param refresh: count events anew, replacing the cached counts
+    :type refresh: bool
+    :param max_files: maximum number of cached counts
+    :type max_files: int
+    """
+    name = "cache"
+    #: number of new counts after which old counts are removed
+    evict_interval = 1000
+    #: seconds after which the last use of a count is updated
+    use_resolution = 24 * 60 * 60
+
+    def __init__(self, counter, cache_path=None, refresh=False, max_files=1000000):
+        self.counter = counter
+        self.cache_path = cache_path or default_cache_path()
+        self.refresh = refresh
+        self.max_files = max_files
+        if not os.path.isdir(os.path.dirname(os.path.abspath(self.cache_path))):
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)))
+        self._db = sqlite3.connect(self.cache_path, timeout=60)
+        # the cache can always be rebuilt, so prefer speed over durability
+        # but keep the default rollback journal, which works on network file systems
+        self._db.execute("PRAGMA synchronous=OFF")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS event_counts ("
+                "path TEXT, tree TEXT, size INTEGER, mtime REAL, entries INTEGER, used REAL,"
+                " PRIMARY KEY (path, tree))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS event_counts_used ON event_counts (used)")
+        self._stored = 0
+
+    def __repr__(self):
+        return "%s(%r, cache_path=%r, refresh=%r)" % (self.__class__.__name__, self.counter, self.cache_path, self.refresh)
+
+    def get_entries(self, file_path, tree_name="Events"):
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        if not self.refresh:
+            record = self._db.execute(
+                "SELECT size, mtime, entries, used FROM event_counts WHERE path = ? AND tree = ?",
+                (file_path, tree_name)
+            ).fetchone()
+            if record is not None and (record[0], record[1]) == (stat.st_size, stat.st_mtime):
+                # avoid writing to the cache for every lookup
+                if record[3] < time.time() - self.use_resolution:
+                    with self._db:
+                        self._db.execute(
+                            "UPDATE event_counts SET used = ? WHERE path = ? AND tree = ?",
+                            (time.time(), file_path, tree_name)
+                        )
+                if record[2] is None:
+                    raise KeyError(tree_name)
+                return record[2]
+        try:
+            entries = self.counter.get_entries(file_path, tree_name)
+        except KeyError:
+            # remember that the tree is missing as well
+            self._store(file_path, tree_name, stat, None)
+            raise
+        self._store(file_path, tree_name, stat, entries)
+        return entries
+
+    def _store(self, file_path, tree_name, stat, entries):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO event_counts VALUES (?, ?, ?, ?, ?, ?)",
+                (file_path, tree_name, stat.st_size, stat.st_mtime, entries, time.time())
+            )
+        self._stored += 1
+        if self._stored % self.evict_interval == 0:
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used counts exceeding ``max_files``"""
+        if self._db.execute("SELECT COUNT(*) FROM event_counts").fetchone()[0] <= self.max_files:
+            return
+        with self._db:
+            self._db.execute(
+                "DELETE FROM event_counts WHERE rowid IN"
+                " (SELECT rowid FROM event_counts ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_files,)
+            )
+
+
+def default_cache_path():
+    """Get the default path of the event count cache"""
+    return os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+        "eawt",
+        "event_counts.sqlite",
+    )
+
+
+#: all backends, by name
+BACKENDS = dict(
+    (counter.name, counter) for counter in (PyROOTCounter, UprootCounter, HeaderCounter, AutoCounter)
+)
+_counters = {}
+
+
+def get_counter(backend="auto", cache=False, cache_path=None, refresh=False):
+    """
+    Get the event counter of a backend
+
+    Each backend is only created once, and reused for subsequent requests.
+
+    :param backend: name of the backend
+    :type backend: str
+    :param cache: use a :py:class:`~.CachedCounter` for the backend
+    :type cache: bool
+    :param cache_path: path of the cache, instead of :py:func:`~.default_cache_path`
+    :type cache_path: str or None
+    :param refresh: count events anew, replacing cached counts
+    :type refresh: bool
+    :rtype: :py:class:`~.EventCounter`
+    :raises InstallationError: if the backend is not available on this host
+    """
+    if cache:
+        cache_key = (backend, cache_path, refresh)
+        try:
+            return _counters[cache_key]
+        except KeyError:
+            counter = _counters[cache_key] = CachedCounter(get_counter(backend), cache_path=cache_path, refresh=refresh)
+            return counter
+    try:
+        counter = _counters[backend]
+    except KeyError:
+        try:
+            counter_cls = BACKENDS[backend]
+        except KeyError:
+            raise ValueError("Unknown event count backend '%s', expected one of %s" % (backend, ", ".join(sorted(BACKENDS))))
+        try:
+            counter = counter_cls()
+        except InstallationError as err:
+            # remember unavailable backends instead of importing them again
+            counter = err
+        _counters[backend] = counter
+    if isinstance(counter, InstallationError):
+        raise counter
+    return counter
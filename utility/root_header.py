@@ -0,0 +1,241 @@
+"""
+Read basic information from ROOT files without ROOT
+
+Only the file header, the keys of the top directory and the start of any
+requested object are read. This requires a few small reads per file instead
+of fully opening it.
+
+**Requires**
+
+:py:mod:`lzma` or :py:mod:`backports.lzma` (optional, for LZMA compressed files)
+
+:note: The built-in parser only supports objects in the top directory of a
+       file, which are either uncompressed or compressed with ZLIB or LZMA.
+       For other objects, it raises :py:exc:`~utility.exceptions.InstallationError`.
+"""
+# standard library imports
+import collections
+import struct
+import zlib
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# third party imports
+
+# application/library imports
+from .exceptions import InstallationError
+
+
+#: key of an object in a ROOT file
+RootKey = collections.namedtuple(
+    "RootKey",
+    ["class_name", "name", "title", "cycle", "seek_key", "key_len", "nbytes", "obj_len"]
+)
+
+# flag marking byte counts in front of streamed objects
+_BYTE_COUNT_MASK = 0x40000000
+# errors of corrupted compressed data
+_DECOMPRESSION_ERRORS = (zlib.error,) + ((lzma.LZMAError,) if lzma is not None else ())
+
+
+def _read_tstring(data, pos):
+    """Read a ROOT TString, returning its value and the position after it"""
+    length = struct.unpack(">B", data[pos:pos + 1])[0]
+    pos += 1
+    if length == 255:
+        length = struct.unpack(">i", data[pos:pos + 4])[0]
+        pos += 4
+    return data[pos:pos + length].decode("latin-1"), pos + length
+
+
+def _decompressor(algorithm):
+    """Get a streaming decompressor for a ROOT compression algorithm"""
+    if algorithm == b"ZL":
+        return zlib.decompressobj()
+    if algorithm == b"XZ":
+        if lzma is None:
+            raise InstallationError("Reading LZMA compressed ROOT files requires the module 'lzma' or 'backports.lzma'")
+        return lzma.LZMADecompressor()
+    raise InstallationError("Reading ROOT files compressed with '%s' is not supported" % algorithm.decode("latin-1"))
+
+
+class RootFile(object):
+    """
+    Minimal reader for the structure of a ROOT file
+
+    :param file_path: path to the ROOT file
+    :type file_path: str
+    :param read_size: size of individual reads from the file
+    :type read_size: int
+
+    :raises ValueError: if the file is not a ROOT file or is truncated
+    """
+    def __init__(self, file_path, read_size=4096):
+        self.file_path = file_path
+        self.read_size = read_size
+        self._file = open(file_path, "rb")
+        self._keys = None
+        try:
+            self._seek_keys, self._nbytes_keys = self._read_header()
+        except struct.error:
+            self.close()
+            raise ValueError("Truncated ROOT file header in '%s'" % file_path)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _read(self, seek, size):
+        self._file.seek(seek)
+        return self._file.read(size)
+
+    def _read_header(self):
+        """Read the location of the top directory's keys from the file header"""
+        header = self._read(0, 64)
+        if header[:4] != b"root":
+            raise ValueError("Not a ROOT file: '%s'" % self.file_path)
+        version, begin = struct.unpack(">ii", header[4:12])
+        # fEND, fSeekFree, fNbytesFree and nfree precede fNbytesName
+        if version >= 1000000:
+            nbytes_name = struct.unpack(">i", header[36:40])[0]
+        else:
+            nbytes_name = struct.unpack(">i", header[28:32])[0]
+        # the top directory follows its key and name at the start of the file
+        directory = self._read(begin + nbytes_name, 42)
+        dir_version = struct.unpack(">h", directory[:2])[0]
+        nbytes_keys = struct.unpack(">i", directory[10:14])[0]
+        if dir_version > 1000:
+            seek_keys = struct.unpack(">q", directory[34:42])[0]
+        else:
+            seek_keys = struct.unpack(">i", directory[26:30])[0]
+        return seek_keys, nbytes_keys
+
+    @staticmethod
+    def _parse_key(data, pos):
+        """Parse a key header, returning the key and the position after it"""
+        nbytes, version, obj_len, _, key_len, cycle = struct.unpack(">ihiIhh", data[pos:pos + 18])
+        str_pos = pos + 18
+        if version > 1000:
+            seek_key = struct.unpack(">q", data[str_pos:str_pos + 8])[0]
+            str_pos += 16
+        else:
+            seek_key = struct.unpack(">i", data[str_pos:str_pos + 4])[0]
+            str_pos += 8
+        class_name, str_pos = _read_tstring(data, str_pos)
+        name, str_pos = _read_tstring(data, str_pos)
+        title, str_pos = _read_tstring(data, str_pos)
+        return RootKey(class_name, name, title, cycle, seek_key, key_len, nbytes, obj_len), pos + key_len
+
+    @property
+    def keys(self):
+        """Keys of all objects in the top directory"""
+        if self._keys is None:
+            data = self._read(self._seek_keys, self._nbytes_keys)
+            try:
+                # the list of keys has a key header itself
+                _, pos = self._parse_key(data, 0)
+                key_count = struct.unpack(">i", data[pos:pos + 4])[0]
+                pos += 4
+                keys = []
+                for _ in range(key_count):
+                    key, pos = self._parse_key(data, pos)
+                    keys.append(key)
+            except struct.error:
+                raise ValueError("Truncated list of keys in '%s'" % self.file_path)
+            self._keys = keys
+        return self._keys
+
+    def get_key(self, name):
+        """
+        Get the key of the object with the highest cycle for a name
+
+        :raises KeyError: if there is no object of this name
+        :raises InstallationError: if the name is a path into a subdirectory
+        """
+        if "/" in name:
+            raise InstallationError(
+                "Reading '%s' from a subdirectory is not supported without uproot or ROOT" % name
+            )
+        try:
+            return max((key for key in self.keys if key.name == name), key=lambda key: key.cycle)
+        except ValueError:
+            raise KeyError(name)
+
+    def read_object(self, key, size):
+        """
+        Read the start of the uncompressed data of an object
+
+        :param key: key of the object
+        :type key: :py:class:`~.RootKey`
+        :param size: number of bytes to read at least, if available
+        :type size: int
+        :return: data of the object
+        :rtype: bytes
+        :raises ValueError: if the data of the object is truncated or corrupted
+        """
+        try:
+            return self._read_object(key, size)
+        except (struct.error,) + _DECOMPRESSION_ERRORS as err:
+            raise ValueError("Corrupted object '%s' in '%s': %s" % (key.name, self.file_path, err))
+
+    def _read_object(self, key, size):
+        seek, data_end = key.seek_key + key.key_len, key.seek_key + key.nbytes
+        if key.obj_len == key.nbytes - key.key_len:
+            return self._read(seek, min(size, key.obj_len))
+        # compressed data is split into blocks, each with a 9 byte header
+        chunks, chunks_size = [], 0
+        while chunks_size < size and seek < data_end:
+            block_header = self._read(seek, 9)
+            block_end = seek + 9 + struct.unpack("<I", block_header[3:6] + b"\0")[0]
+            decompressor = _decompressor(block_header[:2])
+            seek += 9
+            while chunks_size < size and seek < block_end:
+                chunk = decompressor.decompress(self._read(seek, min(self.read_size, block_end - seek)))
+                seek += self.read_size
+                chunks.append(chunk)
+                chunks_size += len(chunk)
+            seek = block_end
+        return b"".join(chunks)
+
+    def get_entries(self, tree_name="Events"):
+        """
+        Get the number of entries of a TTree
+
+        :raises KeyError: if there is no object ``tree_name``
+        :raises ValueError: if the file or tree is truncated or malformed
+        """
+        key = self.get_key(tree_name)
+        size = 256
+        while True:
+            data = self.read_object(key, size)
+            try:
+                return self._parse_entries(data)
+            except struct.error:
+                # title of the tree did not fit into the data read so far
+                if len(data) < size:
+                    raise ValueError("Malformed TTree '%s' in '%s'" % (tree_name, self.file_path))
+                size *= 4
+
+    @staticmethod
+    def _parse_entries(data):
+        """Parse the fEntries of a streamed TTree"""
+        # TTree version header, followed by TNamed, TAttLine, TAttFill and
+        # TAttMarker, each prefixed by its byte count
+        pos = 6
+        for _ in range(4):
+            pos += 4 + (struct.unpack(">I", data[pos:pos + 4])[0] & ~_BYTE_COUNT_MASK)
+        return struct.unpack(">q", data[pos:pos + 8])[0]
+
@@ -1,6 +1,8 @@
 
 # standard library imports
 import os
+import glob
+import fnmatch
 import shutil
 import collections
 
@@ -33,3 +35,40 @@ def ensure_rm(path):
         os.unlink(path)
     elif os.path.isdir(path):
         shutil.rmtree(path)
+
+
+
+def iter_globs(*patterns):
+    """
+    Lazily expand glob patterns, listing every directory only once
+
+    Yields the same paths as :py:func:`glob.glob` for every pattern, but reuses
+    the listing of a directory for all patterns matching files inside it.
+    Paths are yielded as soon as their directory has been listed.
+    """
+    listings = {}
+    for pattern in patterns:
+        if not glob.has_magic(pattern):
+            if os.path.lexists(pattern):
+                yield pattern
+            continue
+        dir_pattern, base_pattern = os.path.split(pattern)
+        dir_names = glob.iglob(dir_pattern) if glob.has_magic(dir_pattern) else [dir_pattern]
+        for dir_name in dir_names:
+            if not base_pattern:
+                # pattern of directories, such as 'foo/*/'
+                if os.path.isdir(dir_name):
+                    yield os.path.join(dir_name, base_pattern)
+                continue
+            try:
+                names = listings[dir_name]
+            except KeyError:
+                try:
+                    names = listings[dir_name] = os.listdir(dir_name or os.curdir)
+                except OSError:
+                    names = listings[dir_name] = []
+            for name in fnmatch.filter(names, base_pattern):
+                # glob ignores hidden files unless explicitly requested
+                if name.startswith(".") and not base_pattern.startswith("."):
+                    continue
+                yield os.path.join(dir_name, name)
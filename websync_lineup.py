@@ -9,6 +9,7 @@ import re
 import glob
 import argparse
 import datetime
+import heapq
 import subprocess
 import random
 
@@ -154,38 +155,41 @@ def compile_comparison(collections, min_count=1):
     """
     Compile a comparison table for all items in given collections
 
+    Collections are merged by basename, using a heap holding the next item of
+    each collection. If a basename occurs several times in a collection, each
+    occurrence is put in a separate row; the n'th occurrences of all
+    collections share a row.
+
     :param collections: collections of items as (dirname, basename)
     :param min_count: filter for minimum number of colelctions an item must be in
     :return: items sorted into rows for a table
-    :rtype: list[list[list[str]]]
+    :rtype: iterable[list[list[str]]]
     """
-    comparison_rows = []
-    # order in reverse since list pops from the back
-    collections = [sorted(collection, reverse=True, key=lambda item: item[1]) for collection in collections]
-    current_items = [None]*len(collections)
-    while any(any(collection) for collection in collections):
-        # advance any empty == consumed item to the next in its owning list
-        for ci_idx in xrange(len(current_items)):
-            if current_items[ci_idx] is None:
-                try:
-                    current_items[ci_idx] = collections[ci_idx].pop()
-                except IndexError:
-                    current_items[ci_idx] = None
+    collections = [iter(sorted(collection, key=lambda item: item[1])) for collection in collections]
+    # the heap holds at most one item per collection
+    heap = []
+    for ci_idx, collection in enumerate(collections):
+        for item in collection:
+            heap.append((item[1], ci_idx, item))
+            break
+    heapq.heapify(heap)
+    while heap:
         # extract all items that match the lexicographically next one
-        this_row = []
-        current_base = min(item[1] for item in current_items if item is not None)
+        current_base = heap[0][0]
+        this_row = [None] * len(collections)
         current_count = 0
-        for ci_idx in xrange(len(current_items)):
-            if current_items[ci_idx] is not None and current_items[ci_idx][1] == current_base:
-                this_row.append(current_items[ci_idx])
-                current_count += 1
-                current_items[ci_idx] = None
-                continue
-            else:
-                this_row.append(None)
+        while heap and heap[0][0] == current_base:
+            _, ci_idx, item = heapq.heappop(heap)
+            this_row[ci_idx] = item
+            current_count += 1
+        # advance consumed collections only now, so duplicates go to the next row
+        for ci_idx, item in enumerate(this_row):
+            if item is not None:
+                for next_item in collections[ci_idx]:
+                    heapq.heappush(heap, (next_item[1], ci_idx, next_item))
+                    break
         if current_count >= min_count:
-            comparison_rows.append(this_row)
-    return comparison_rows
+            yield this_row
 
 
 def xformat_comparison_to_html(comparison_rows, headers=False):